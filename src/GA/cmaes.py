@@ -0,0 +1,212 @@
+# MIT License
+#
+# Copyright (c) 2020 Carlos Moreno
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+"""
+CMA-ES class
+
+"""
+
+#######################################################################
+# Imports area
+#######################################################################
+
+# Generic / Built-in
+
+
+# Other Libs
+import numpy as np
+
+
+# Own Libs
+from GA.optimiser import Optimiser
+
+
+#######################################################################
+
+
+class CMAES(Optimiser):
+    """
+    Class to represent a covariance matrix adaptation evolution strategy,
+    (μ/μ_w, λ)-CMA-ES, searching in the box of the genes scaled to the
+    unit hypercube.
+
+    Attributes
+    ----------
+    covariance : np.ndarray (NxN) [float]
+        Covariance matrix of the search distribution
+
+    mean : np.ndarray (N) [float]
+        Mean of the search distribution, in the unit hypercube
+
+    sigma : float
+        Step size of the search distribution
+
+
+    Methods
+    ----------
+    initialise_population(seeds)
+        Initialise the search distribution at the centre of the box, or
+        over the seeds
+
+    optimise(callback)
+        Optimise the fitness problem
+
+    """
+    def __init__(self, config: dict, fitnessFunc, evaluator=None):
+        """
+        Constructor of a CMA-ES.
+
+        Parameters
+        ----------
+        config : dict
+            Configuration of the optimiser
+
+        fitnessFunc : function
+            Fitness function to optimise
+
+        evaluator : ~evaluator.Evaluator, optional
+            Batched evaluator of the fitness function
+
+        Returns
+        ----------
+
+        """
+        super().__init__(config, fitnessFunc, evaluator)
+        self.covariance = None
+        self.mean = None
+        self.sigma = None
+        self._evolutionPaths = None
+
+    def initialise_population(self, seeds=None):
+        """
+        Initialise the search distribution at the centre of the box, or
+        with the mean and the spread of the seeds.
+
+        Parameters
+        ----------
+        seeds : np.ndarray (MxN) [float], optional
+            Chromosomes to start from, such as the elite of a previous run
+
+        Returns
+        ----------
+
+        """
+        numGenes = self.config['num_genes']
+
+        self.numInd = self.config['size_population']
+        self.sigma = self.config.get('cmaes_sigma', 0.3)
+        self.covariance = np.eye(numGenes)
+        if seeds is None or len(seeds) == 0:
+            self.mean = np.full(numGenes, 0.5)
+        else:
+            minValues, maxValues = self._bounds()
+            seeds = np.clip((np.asarray(seeds, dtype=float) - minValues)
+                            / (maxValues - minValues), 0, 1)
+            self.mean = np.mean(seeds, axis=0)
+
+            # The distribution starts as wide as the seeds along each gene
+            if len(seeds) > 1:
+                variances = np.maximum(np.var(seeds, axis=0), 1e-6)
+                self.sigma = float(np.sqrt(np.mean(variances)))
+                self.covariance = np.diag(variances / self.sigma**2)
+        self._evolutionPaths = (np.zeros(numGenes), np.zeros(numGenes))
+
+    def optimise(self, callback=None):
+        """
+        Optimise the problem.
+
+        Parameters
+        ----------
+        callback : function, optional
+            Called after each generation with the generation number and
+            the optimiser, to report the progress
+
+        Returns
+        ----------
+
+        """
+        # pylint: disable=too-many-locals
+        optimiseDict = {'maximise': -1,
+                        'minimise': 1
+                        }
+        sign = optimiseDict[self.config['optimisation']]
+
+        n = self.config['num_genes']
+        numParents = self.numInd // 2
+        minValues, maxValues = self._bounds()
+
+        # Default strategy parameters (Hansen, The CMA Evolution Strategy:
+        # A Tutorial, 2016)
+        weights = np.log(numParents + 0.5) \
+            - np.log(np.arange(1, numParents + 1))
+        weights /= np.sum(weights)
+        muEff = 1 / np.sum(weights**2)
+
+        cc = (4 + muEff/n) / (n + 4 + 2*muEff/n)
+        cs = (muEff + 2) / (n + muEff + 5)
+        c1 = 2 / ((n + 1.3)**2 + muEff)
+        cmu = min(1 - c1, 2 * (muEff - 2 + 1/muEff) / ((n + 2)**2 + muEff))
+        damps = 1 + 2 * max(0, np.sqrt((muEff - 1) / (n + 1)) - 1) + cs
+        chiN = np.sqrt(n) * (1 - 1/(4*n) + 1/(21*n**2))
+
+        pc, ps = self._evolutionPaths
+
+        for generation in range(self.config['num_generations']):
+            eigenValues, eigenVectors = np.linalg.eigh(self.covariance)
+            eigenValues = np.sqrt(np.maximum(eigenValues, 1e-20))
+
+            # Offspring repaired into the box
+            steps = (np.random.randn(self.numInd, n) * eigenValues) \
+                @ eigenVectors.T
+            samples = np.clip(self.mean + self.sigma * steps, 0, 1)
+            steps = (samples - self.mean) / self.sigma
+
+            self.scores = self._evaluate(minValues + samples
+                                         * (maxValues - minValues))
+
+            # Failed integrations (NaN) are sorted last
+            parents = np.argsort(sign * self.scores)[:numParents]
+            stepMean = weights @ steps[parents]
+            self.mean = self.mean + self.sigma * stepMean
+
+            invSqrtCovariance = eigenVectors @ np.diag(1 / eigenValues) \
+                @ eigenVectors.T
+            ps = (1 - cs) * ps \
+                + np.sqrt(cs * (2 - cs) * muEff) * invSqrtCovariance @ stepMean
+            hSigma = np.linalg.norm(ps) \
+                / np.sqrt(1 - (1 - cs)**(2 * (generation + 1))) / chiN \
+                < 1.4 + 2 / (n + 1)
+            pc = (1 - cc) * pc \
+                + hSigma * np.sqrt(cc * (2 - cc) * muEff) * stepMean
+
+            self.covariance = (1 - c1 - cmu) * self.covariance \
+                + c1 * (np.outer(pc, pc)
+                        + (1 - hSigma) * cc * (2 - cc) * self.covariance) \
+                + cmu * (steps[parents].T * weights) @ steps[parents]
+            self.sigma *= np.exp(cs / damps
+                                 * (np.linalg.norm(ps) / chiN - 1))
+
+            self._evolutionPaths = (pc, ps)
+
+            if callback is not None:
+                callback(generation, self)
@@ -0,0 +1,156 @@
+# MIT License
+#
+# Copyright (c) 2020 Carlos Moreno
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+"""
+Differential evolution class
+
+"""
+
+#######################################################################
+# Imports area
+#######################################################################
+
+# Generic / Built-in
+
+
+# Other Libs
+import numpy as np
+
+
+# Own Libs
+from GA.optimiser import Optimiser
+
+
+#######################################################################
+
+
+class DifferentialEvolution(Optimiser):
+    """
+    Class to represent a differential evolution, DE/rand/1/bin.
+
+    Attributes
+    ----------
+    chromosomes : np.ndarray (self.numInd x N) [float]
+        Chromosomes of the current population
+
+
+    Methods
+    ----------
+    initialise_population(seeds)
+        Initialise and evaluate the population given certain values at
+        the config
+
+    optimise(callback)
+        Optimise the fitness problem
+
+    """
+    def __init__(self, config: dict, fitnessFunc, evaluator=None):
+        """
+        Constructor of a differential evolution.
+
+        Parameters
+        ----------
+        config : dict
+            Configuration of the optimiser
+
+        fitnessFunc : function
+            Fitness function to optimise
+
+        evaluator : ~evaluator.Evaluator, optional
+            Batched evaluator of the fitness function
+
+        Returns
+        ----------
+
+        """
+        super().__init__(config, fitnessFunc, evaluator)
+        self.chromosomes = None
+
+    def initialise_population(self, seeds=None):
+        """
+        Initialise and evaluate the population.
+
+        Parameters
+        ----------
+        seeds : np.ndarray (MxN) [float], optional
+            Chromosomes of the first individuals, the rest are sampled
+
+        Returns
+        ----------
+
+        """
+        self.chromosomes = self._initial_chromosomes(seeds)
+        self.numInd = len(self.chromosomes)
+        self.scores = self._evaluate(self.chromosomes)
+
+    def optimise(self, callback=None):
+        """
+        Optimise the problem.
+
+        Parameters
+        ----------
+        callback : function, optional
+            Called after each generation with the generation number and
+            the optimiser, to report the progress
+
+        Returns
+        ----------
+
+        """
+        optimiseDict = {'maximise': -1,
+                        'minimise': 1
+                        }
+        sign = optimiseDict[self.config['optimisation']]
+
+        numInd, numGenes = self.chromosomes.shape
+        weight = self.config.get('de_weight', 0.8)
+        crossover = self.config.get('de_crossover', 0.9)
+        minValues, maxValues = self._bounds()
+
+        for generation in range(self.config['num_generations']):
+            # Three different donors for each individual, none itself
+            randomKeys = np.random.rand(numInd, numInd)
+            np.fill_diagonal(randomKeys, np.inf)
+            donors = np.argsort(randomKeys, axis=1)[:, :3]
+
+            mutants = self.chromosomes[donors[:, 0]] + weight \
+                * (self.chromosomes[donors[:, 1]]
+                   - self.chromosomes[donors[:, 2]])
+
+            # Binomial crossover, with at least one gene of the mutant
+            crossed = np.random.rand(numInd, numGenes) < crossover
+            crossed[np.arange(numInd),
+                    np.random.randint(0, numGenes, numInd)] = True
+            trials = np.clip(np.where(crossed, mutants, self.chromosomes),
+                             minValues, maxValues)
+
+            trialScores = self._evaluate(trials)
+
+            # Failed integrations (NaN) are always replaced
+            improved = (sign * trialScores <= sign * self.scores) \
+                | np.isnan(self.scores)
+            self.chromosomes[improved] = trials[improved]
+            self.scores[improved] = trialScores[improved]
+
+            if callback is not None:
+                callback(generation, self)
@@ -149,7 +149,7 @@ class Individual():
         """
         # Select the crossover method for the offspring
         offspringDict = {'one_point': self._crossover_one_point,
-                         'multiple_points': None,
+                         'multiple_points': self._crossover_multiple_points,
                          'different_points': self._crossover_different_points}
 
         return offspringDict[self.crossover](secondParent)
@@ -170,7 +170,7 @@ class Individual():
         """
 
         mutationDict = {'normal': self._mutation_normal,
-                        'uniform': None}
+                        'uniform': self._mutation_uniform}
 
         mutationDict[self.mutation](pressure)
 
@@ -209,6 +209,42 @@ class Individual():
 
         return child1
 
+    def _crossover_multiple_points(self, secondParent):
+        """
+        Computates the offspring of two individuals.
+
+
+        Parameters
+        ----------
+        secondParent : ~individual.Individual
+            Second individual implied in the crossover
+
+        Returns
+        -------
+        child1 : ~individual.Individual
+            First individual of the offspring
+
+        """
+        N = self.numGenes
+        # Two cut points, the genes between them come from second parent
+        cutPoints = np.sort(np.random.choice(a=np.arange(1, N),
+                                             size=min(2, N - 1),
+                                             replace=False))
+        segments = np.searchsorted(cutPoints, np.arange(N), side='right')
+        chromosomeLogical2 = segments % 2 == 1
+
+        chromosome1 = self.chromosome.copy()
+
+        # Creates the chromosomes intersecting both parent genes
+        chromosome1[chromosomeLogical2] = \
+            secondParent.chromosome[chromosomeLogical2]
+
+        # Creates the child
+        child1 = self.__class__(self.fitnessFunc, self.crossover,
+                                self.mutation, chromosome1)
+
+        return child1
+
     def _crossover_different_points(self, secondParent):
         """
         Computates the offspring of two individuals.
@@ -272,3 +308,28 @@ class Individual():
         for gene in mutatedGenes:
             self.chromosome[gene] += np.random.normal(self.chromosome[gene],
                                                       np.std(self.chromosome))
+
+    def _mutation_uniform(self, pressure) -> None:
+        """
+        Create mutations on the individual.
+
+
+        Parameters
+        ----------
+        pressure : float
+            Percentage of genes to mutate
+
+        Returns
+        -------
+
+        """
+        nMutatedGenes = int(pressure * self.numGenes)
+
+        # Select the mutated genes
+        mutatedGenes = np.random.randint(0, self.numGenes, nMutatedGenes)
+        mutatedGenes = list(set(mutatedGenes))
+
+        # Add a uniform error over the mutated genes
+        for gene in mutatedGenes:
+            self.chromosome[gene] += np.random.uniform(
+                -1, 1) * np.std(self.chromosome)
@@ -0,0 +1,410 @@
+# MIT License
+#
+# Copyright (c) 2020 Carlos Moreno
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+"""
+Optimiser class
+
+"""
+
+#######################################################################
+# Imports area
+#######################################################################
+
+# Generic / Built-in
+
+
+# Other Libs
+import numpy as np
+from scipy.stats import qmc
+
+
+# Own Libs
+
+
+#######################################################################
+
+
+class Optimiser():
+    """
+    Base class of the optimisers, which share the evaluation of the
+    fitness function and the archive of the evaluations.
+
+    Attributes
+    ----------
+    archive : tuple (np.ndarray (MxN), np.ndarray (M))
+        Chromosomes evaluated with the fitness function and their scores
+
+    config : dict
+        Configuration of the optimiser
+
+    evaluator : ~evaluator.Evaluator
+        Batched evaluator of the fitness function, None to evaluate
+        each chromosome on its own
+
+    fitnessFunc : function
+        Fitness function to optimise
+
+    numInd : int
+        Number of individuals evaluated in each generation
+
+    scores : np.ndarray (self.numInd) [float]
+        Fitting scores of the last evaluated generation
+
+
+    Methods
+    ----------
+    best()
+        Return the best chromosome evaluated and its score
+
+    elite(numElite)
+        Return the best different chromosomes evaluated and their scores
+
+    initialise_population(seeds)
+        Initialise the optimiser given certain values at the config, or
+        warm started from known chromosomes
+
+    optimise(callback)
+        Optimise the fitness problem
+
+    validate(numElite, tolerance)
+        Return the best chromosome of the elite scored in float64
+
+    """
+    def __init__(self, config: dict, fitnessFunc, evaluator=None):
+        """
+        Constructor of a generic optimiser.
+
+        Parameters
+        ----------
+        config : dict
+            Configuration of the optimiser
+
+        fitnessFunc : function
+            Fitness function to optimise
+
+        evaluator : ~evaluator.Evaluator, optional
+            Batched evaluator of the fitness function
+
+        Returns
+        ----------
+
+        """
+        self.config = config
+        self.evaluator = evaluator
+        self.fitnessFunc = fitnessFunc
+        self.numInd = None
+        self.scores = None
+        self.archive = (np.zeros((0, config['num_genes'])), np.zeros(0))
+
+    def best(self) -> tuple:
+        """
+        Returns the best chromosome of the archive.
+
+        Parameters
+        ----------
+
+        Returns
+        ----------
+        chromosome : np.ndarray (N) [float]
+            Best chromosome evaluated
+
+        score : float
+            Score of the best chromosome
+
+        """
+        optimiseDict = {'maximise': np.nanargmax,
+                        'minimise': np.nanargmin
+                        }
+        index = optimiseDict[self.config['optimisation']](self.archive[1])
+
+        return self.archive[0][index], self.archive[1][index]
+
+    def elite(self, numElite: int) -> tuple:
+        """
+        Returns the best different chromosomes of the archive.
+
+        Parameters
+        ----------
+        numElite : int
+            Maximum number of chromosomes
+
+        Returns
+        ----------
+        chromosomes : np.ndarray (numElite x N) [float]
+            Best chromosomes evaluated, from best to worst
+
+        scores : np.ndarray (numElite) [float]
+            Scores of the chromosomes
+
+        """
+        elite = elite_indices(self.archive[0], self.archive[1],
+                              self.config['optimisation'], numElite)
+
+        return self.archive[0][elite], self.archive[1][elite]
+
+    def validate(self, numElite: int, tolerance: float) -> tuple:
+        """
+        Scores again in float64 the best chromosomes of the archive, when
+        the evaluator integrates with a lower precision, and returns the
+        best of them.
+
+        Parameters
+        ----------
+        numElite : int
+            Number of different chromosomes scored again
+
+        tolerance : float
+            Relative difference of the scores allowed before warning
+
+        Returns
+        ----------
+        chromosome : np.ndarray (N) [float]
+            Best chromosome of the elite
+
+        score : float
+            Score in float64 of the best chromosome
+
+        """
+        if self.evaluator is None or self.evaluator.precision == 'float64':
+            return self.best()
+
+        optimiseDict = {'maximise': -1,
+                        'minimise': 1
+                        }
+        elite = elite_indices(self.archive[0], self.archive[1],
+                              self.config['optimisation'], numElite)
+
+        scores = self.evaluator.rescore(self.archive[0][elite],
+                                        self.archive[1][elite], tolerance)
+        self.archive[1][elite] = scores
+
+        best = elite[np.argsort(optimiseDict[self.config['optimisation']]
+                                * scores)[0]]
+
+        return self.archive[0][best], self.archive[1][best]
+
+    def initialise_population(self, seeds=None):
+        """
+        Initialise the optimiser.
+
+        Parameters
+        ----------
+        seeds : np.ndarray (MxN) [float], optional
+            Chromosomes to start from, such as the elite of a previous
+            optimisation, from best to worst
+
+        Returns
+        ----------
+
+        """
+        raise NotImplementedError
+
+    def optimise(self, callback=None):
+        """
+        Optimise the problem.
+
+        Parameters
+        ----------
+        callback : function, optional
+            Called after each generation with the generation number and
+            the optimiser, to report the progress
+
+        Returns
+        ----------
+
+        """
+        raise NotImplementedError
+
+    def _bounds(self) -> tuple:
+        """
+        Bounds of the genes, given at the config for all the genes or
+        for each of them
+
+        Parameters
+        ----------
+
+        Returns
+        ----------
+        minValues : np.ndarray (N) [float]
+            Lower bound of each gene
+
+        maxValues : np.ndarray (N) [float]
+            Upper bound of each gene
+
+        """
+        numGenes = self.config['num_genes']
+        minValues = np.broadcast_to(self.config['min_values'], numGenes)
+        maxValues = np.broadcast_to(self.config['max_values'], numGenes)
+
+        return minValues.astype(float), maxValues.astype(float)
+
+    def _evaluate(self, chromosomes: np.ndarray) -> np.ndarray:
+        """
+        Evaluates the chromosomes with the fitness function, through the
+        evaluator if there is one, and stores them in the archive
+
+        Parameters
+        ----------
+        chromosomes : np.ndarray (MxN) [float]
+            Chromosomes to evaluate
+
+        Returns
+        ----------
+        scores : np.ndarray (M) [float]
+            Scores of the chromosomes
+
+        """
+        if self.evaluator is not None:
+            scores = self.evaluator(chromosomes)
+        else:
+            fitnessConfig = self.config['fitness_function']
+            scores = np.array([self.fitnessFunc(**dict(fitnessConfig,
+                                                       params=chromosome))
+                               for chromosome in chromosomes])
+
+        self._archive(chromosomes, scores)
+
+        return scores
+
+    def _initial_chromosomes(self, seeds=None) -> np.ndarray:
+        """
+        Chromosomes of a first population, the seeds completed with
+        samples of the box between min_values and max_values
+
+        Parameters
+        ----------
+        seeds : np.ndarray (MxN) [float], optional
+            Chromosomes to start from
+
+        Returns
+        ----------
+        chromosomes : np.ndarray (size_population x N) [float]
+            Chromosomes of the population
+
+        """
+        numInd = self.config['size_population']
+        seeds = np.zeros((0, self.config['num_genes'])) if seeds is None \
+            else np.array(seeds, dtype=float)[:numInd]
+
+        minValues, maxValues = self._bounds()
+        samples = sample_unit_cube(self.config.get('initialisation',
+                                                   'random'),
+                                   numInd - len(seeds),
+                                   self.config['num_genes'])
+
+        return np.vstack((seeds, minValues + samples
+                          * (maxValues - minValues)))
+
+    def _archive(self, chromosomes: np.ndarray, scores: np.ndarray) -> None:
+        """
+        Stores the evaluated chromosomes in the fitness archive
+
+        Parameters
+        ----------
+        chromosomes : np.ndarray (MxN) [float]
+            Chromosomes evaluated with the fitness function
+
+        scores : np.ndarray (M) [float]
+            Scores of the evaluated chromosomes
+
+        Returns
+        ----------
+
+        """
+        self.archive = (np.vstack((self.archive[0], chromosomes)),
+                        np.concatenate((self.archive[1], scores)))
+
+
+def elite_indices(chromosomes: np.ndarray, scores: np.ndarray,
+                  optimisation: str, numElite: int) -> np.ndarray:
+    """
+    Indices of the best different chromosomes of an archive
+
+    Parameters
+    ----------
+    chromosomes : np.ndarray (MxN) [float]
+        Chromosomes of the archive
+
+    scores : np.ndarray (M) [float]
+        Scores of the chromosomes
+
+    optimisation : str
+        'minimise' or 'maximise' the scores
+
+    numElite : int
+        Maximum number of chromosomes
+
+    Returns
+    ----------
+    elite : np.ndarray (numElite) [int]
+        Indices of the chromosomes, from best to worst
+
+    """
+    optimiseDict = {'maximise': -1,
+                    'minimise': 1
+                    }
+    order = np.argsort(optimiseDict[optimisation] * scores)
+
+    # Repeated chromosomes are taken only once
+    _, first = np.unique(chromosomes[order], axis=0, return_index=True)
+
+    return order[np.sort(first)[:numElite]]
+
+
+def sample_unit_cube(method: str, numSamples: int,
+                     numGenes: int) -> np.ndarray:
+    """
+    Samples the unit hypercube with random or quasi-random points
+
+    Parameters
+    ----------
+    method : str
+        'random', 'lhs' (Latin hypercube) or 'sobol' (scrambled Sobol
+        sequence)
+
+    numSamples : int
+        Number of points
+
+    numGenes : int
+        Dimension of the hypercube
+
+    Returns
+    ----------
+    samples : np.ndarray (numSamples x numGenes) [float]
+        Points in [0, 1)
+
+    """
+    if method == 'random':
+        return np.random.rand(numSamples, numGenes)
+
+    samplerDict = {'lhs': qmc.LatinHypercube,
+                   'sobol': qmc.Sobol}
+    sampler = samplerDict[method](numGenes,
+                                  seed=np.random.randint(2**31))
+
+    if method == 'sobol':
+        # The balance of a Sobol sequence needs a power of 2 of points
+        exponent = int(np.ceil(np.log2(max(numSamples, 1))))
+        return sampler.random_base2(exponent)[:numSamples]
+
+    return sampler.random(numSamples)
@@ -43,20 +43,29 @@ import numpy as np
 
 # Own Libs
 from GA.individual import Individual
+from GA.optimiser import Optimiser
+from GA.surrogate import Surrogate
 
 
 #######################################################################
 
 
-class Population():
+class Population(Optimiser):
     """
-    Class to represent a population.
+    Class to represent a population of a genetic algorithm.
 
     Attributes
     ----------
+    archive : tuple (np.ndarray (MxN), np.ndarray (M))
+        Chromosomes evaluated with the fitness function and their scores
+
     config : dict
         Configuration of the population
 
+    evaluator : ~evaluator.Evaluator
+        Batched evaluator of the fitness function, None to evaluate
+        each individual on its own
+
     fitnessFunc : function
         Fitness function associated to individual
 
@@ -66,10 +75,16 @@ class Population():
     numInd : int
         Number of individuals in the population
 
+    scores : np.ndarray (self.numInd) [float]
+        Fitting scores of the last evaluated generation
+
+    surrogate : ~surrogate.Surrogate
+        Surrogate of the fitness function, None if not configured
+
 
     Methods
     ----------
-    initialise_population()
+    initialise_population(seeds)
         Initialise the population given certain values at the config
 
     mutation()
@@ -78,12 +93,13 @@ class Population():
     new_generation()
         Computes the new generation of individuals
 
-    optimise()
+    optimise(callback)
         Optimise the population to the fitness problem
 
 
     """
-    def __init__(self, config: dict, fitnessFunc, individuals=None):
+    def __init__(self, config: dict, fitnessFunc, individuals=None,
+                 evaluator=None):
         """
         Constructor of a generic population.
 
@@ -98,21 +114,31 @@ class Population():
         individuals : list [~src.ga.individual]
             Individual of a population
 
+        evaluator : ~evaluator.Evaluator, optional
+            Batched evaluator of the fitness function
+
         Returns
         ----------
 
         """
-        self.config = config
-        self.fitnessFunc = fitnessFunc
+        super().__init__(config, fitnessFunc, evaluator)
         self.individuals = individuals
-        self.numInd = None
 
-    def initialise_population(self):
+        if config.get('surrogate', False):
+            self.surrogate = Surrogate(config['surrogate_neighbours'],
+                                       config['surrogate_min_archive'])
+        else:
+            self.surrogate = None
+
+    def initialise_population(self, seeds=None):
         """
-        Initialise the individuals of a population.
+        Initialise the individuals of a population, sampling the box
+        between min_values and max_values, which can be given per gene.
 
         Parameters
         ----------
+        seeds : np.ndarray (MxN) [float], optional
+            Chromosomes of the first individuals, the rest are sampled
 
         Returns
         ----------
@@ -122,11 +148,7 @@ class Population():
         self.individuals = []
         indAp = self.individuals.append
 
-        for _ in range(config['size_population']):
-            chromosome = np.random.rand(config['num_genes']) \
-                * (config['max_values'] - config['min_values']) \
-                + config['min_values']
-
+        for chromosome in self._initial_chromosomes(seeds):
             indAp(Individual(self.fitnessFunc,
                              config['crossover'],
                              config['mutation'],
@@ -168,7 +190,8 @@ class Population():
                         }
         m = optimiseDict[self.config['optimisation']]
 
-        scores = np.array(self._scores())**m
+        self.scores = np.array(self._scores())
+        scores = self.scores**m
         newGeneration = []
         newGenAp = newGeneration.append
 
@@ -184,20 +207,26 @@ class Population():
         newGeneration = newGeneration[:self.numInd]
         self.individuals = newGeneration
 
-    def optimise(self):
+    def optimise(self, callback=None):
         """
         Optimise the problem.
 
         Parameters
         ----------
+        callback : function, optional
+            Called after each generation with the generation number and
+            the population, to report the progress
 
         Returns
         ----------
 
         """
-        for _ in range(self.config['num_generations']):
+        for generation in range(self.config['num_generations']):
             self.new_generation()
 
+            if callback is not None:
+                callback(generation, self)
+
             self.mutation(self.config['prob_mutation'])
 
     def _select_individuals(self, scores: np.ndarray) -> np.ndarray:
@@ -251,7 +280,9 @@ class Population():
     def _scores(self):
         """
         Computes the score for each individual chromosome against the
-        fitness function
+        fitness function. With a surrogate, only the most promising
+        fraction of the individuals is evaluated and the rest keep their
+        predicted score.
 
         Parameters
         ----------
@@ -262,8 +293,44 @@ class Population():
 
 
         """
+        chromosomes = np.array([individual.chromosome
+                                for individual in self.individuals])
+
+        if self.surrogate is not None and self.surrogate.ready():
+            optimiseDict = {'maximise': -1,
+                            'minimise': 1
+                            }
+            scores = self.surrogate.predict(chromosomes)
+            numEvaluated = int(np.ceil(self.config['surrogate_fraction']
+                                       * self.numInd))
+            evaluated = np.argsort(optimiseDict[self.config['optimisation']]
+                                   * scores)[:numEvaluated]
+        else:
+            scores = np.zeros(len(self.individuals))
+            evaluated = np.arange(len(self.individuals))
+
+        scores[evaluated] = self._evaluate(chromosomes[evaluated])
+
+        return list(scores)
+
+    def _archive(self, chromosomes: np.ndarray, scores: np.ndarray) -> None:
+        """
+        Stores the evaluated chromosomes in the fitness archive and
+        refits the surrogate with them
 
-        scores = [individual.fitness_function(self.config['fitness_function'])
-                  for individual in self.individuals]
+        Parameters
+        ----------
+        chromosomes : np.ndarray (MxN) [float]
+            Chromosomes evaluated with the fitness function
+
+        scores : np.ndarray (M) [float]
+            Scores of the evaluated chromosomes
+
+        Returns
+        ----------
+
+        """
+        super()._archive(chromosomes, scores)
 
-        return scores
+        if self.surrogate is not None:
+            self.surrogate.update(chromosomes, scores)
@@ -0,0 +1,173 @@
+# MIT License
+#
+# Copyright (c) 2020 Carlos Moreno
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+"""
+Surrogate class
+
+"""
+
+#######################################################################
+# Imports area
+#######################################################################
+
+# Generic / Built-in
+
+
+# Other Libs
+import numpy as np
+
+
+# Own Libs
+
+
+#######################################################################
+
+
+class Surrogate():
+    """
+    Class to represent a k-nearest neighbours surrogate of the fitness
+    function, fitted over the chromosomes already evaluated.
+
+    Attributes
+    ----------
+    chromosomes : np.ndarray (MxN) [float]
+        Chromosomes evaluated with the fitness function
+
+    minArchive : int
+        Number of evaluations needed before predicting
+
+    numNeighbours : int
+        Number of neighbours of the inverse distance interpolation
+
+    scores : np.ndarray (M) [float]
+        Scores of the evaluated chromosomes
+
+
+    Methods
+    ----------
+    predict(chromosomes)
+        Return the predicted scores of the chromosomes
+
+    ready()
+        Return whether there are enough evaluations to predict
+
+    update(chromosomes, scores)
+        Add new evaluations to the surrogate
+
+    """
+    def __init__(self, numNeighbours: int, minArchive: int):
+        """
+        Constructor of a surrogate.
+
+        Parameters
+        ----------
+        numNeighbours : int
+            Number of neighbours of the inverse distance interpolation
+
+        minArchive : int
+            Number of evaluations needed before predicting
+
+        Returns
+        ----------
+
+        """
+        self.numNeighbours = numNeighbours
+        self.minArchive = minArchive
+        self.chromosomes = None
+        self.scores = None
+        self._scale = None
+
+    def ready(self) -> bool:
+        """
+        Checks if the surrogate can already predict.
+
+        Parameters
+        ----------
+
+        Returns
+        ----------
+        ready : bool
+            Whether there are enough evaluations to predict
+
+        """
+        return self.scores is not None and len(self.scores) >= self.minArchive
+
+    def update(self, chromosomes: np.ndarray, scores: np.ndarray) -> None:
+        """
+        Adds new evaluations to the surrogate, which is refitted
+        incrementally by rescaling the genes.
+
+        Parameters
+        ----------
+        chromosomes : np.ndarray (MxN) [float]
+            Chromosomes evaluated with the fitness function
+
+        scores : np.ndarray (M) [float]
+            Scores of the evaluated chromosomes
+
+        Returns
+        ----------
+
+        """
+        if self.scores is None:
+            self.chromosomes = np.array(chromosomes, dtype=float)
+            self.scores = np.array(scores, dtype=float)
+        else:
+            self.chromosomes = np.vstack((self.chromosomes, chromosomes))
+            self.scores = np.concatenate((self.scores, scores))
+
+        # Genes are compared in units of their spread in the archive
+        scale = np.std(self.chromosomes, axis=0)
+        scale[scale == 0] = 1
+        self._scale = scale
+
+    def predict(self, chromosomes: np.ndarray) -> np.ndarray:
+        """
+        Predicts the scores of the chromosomes by inverse distance
+        weighting of their nearest evaluated neighbours.
+
+        Parameters
+        ----------
+        chromosomes : np.ndarray (QxN) [float]
+            Chromosomes to predict
+
+        Returns
+        ----------
+        predicted : np.ndarray (Q) [float]
+            Predicted scores
+
+        """
+        k = min(self.numNeighbours, len(self.scores))
+
+        difference = (chromosomes[:, None, :] - self.chromosomes[None, :, :]) \
+            / self._scale
+        distances = np.sqrt(np.sum(difference**2, axis=-1))
+
+        neighbours = np.argpartition(distances, k-1, axis=1)[:, :k]
+        distances = np.take_along_axis(distances, neighbours, axis=1)
+
+        # Chromosomes already evaluated keep their exact score
+        weights = 1 / np.maximum(distances, 1e-12)**2
+        weights /= np.sum(weights, axis=1, keepdims=True)
+
+        return np.sum(weights * self.scores[neighbours], axis=1)
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#    Epidemic Models - Calculates parameters of epidemic models
+#    Copyright (C) 2020 Carlos Moreno
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#    See LICENSE
+
+"""
+Integrator benchmark
+
+Reference trajectories of a set of parameters spread over the bounds of
+the population are integrated with a tight tolerance adaptive solver
+and cached. Then every integrator and step is run over the same
+parameters, and the error at the observation days is compared with the
+evaluations of the model and the time it takes.
+
+"""
+
+#######################################################################
+# Imports area
+#######################################################################
+
+# Generic / Built-in
+from functools import partial
+import hashlib
+import os
+import time
+
+# Other Libs
+import numpy as np
+import toml
+from scipy.integrate import solve_ivp
+from scipy.stats import qmc
+
+# Own Libs
+from evaluator import get_curves_batch
+from integrators import INTEGRATORS
+from main import hash_mobility, load_fitness_config
+from models import EPIDEMIC_MODELS
+
+#######################################################################
+
+
+def main():
+    """
+    Main program to benchmark the integrators
+
+    Parameters
+    ----------
+
+    Returns
+    ----------
+    results : list [dict]
+        Error and cost of each integrator and step
+
+    """
+    config = toml.load('../config/configuration.toml', _dict=dict)
+    benchmarkConfig = config['benchmark']
+    populationConfig = config['population']
+    fitnessConfig = load_fitness_config(config)
+
+    sampler = qmc.Sobol(populationConfig['num_genes'],
+                        seed=benchmarkConfig['seed'])
+    params = qmc.scale(sampler.random(benchmarkConfig['samples']),
+                       np.broadcast_to(populationConfig['min_values'],
+                                       populationConfig['num_genes']),
+                       np.broadcast_to(populationConfig['max_values'],
+                                       populationConfig['num_genes']))
+
+    numDays = fitnessConfig['realData'].shape[0]
+    golden, goldenError = load_golden(
+        os.path.join(benchmarkConfig['cache_dir'],
+                     f"golden_{fitnessConfig['epidemicModel']}.npz"),
+        fitnessConfig, params, numDays, benchmarkConfig['rtol'],
+        benchmarkConfig['atol'])
+
+    results = [measure(fitnessConfig, params, golden, integrator, step,
+                       benchmarkConfig['repeats'])
+               for integrator in benchmarkConfig['integrators']
+               for step in benchmarkConfig['steps']]
+    pareto_front(results)
+
+    # Cheapest configuration within the tolerance
+    accurate = [result for result in results
+                if result['maxError'] <= benchmarkConfig['tolerance']]
+    chosen = min(accurate, key=lambda result: result['time'], default=None)
+
+    print(f'{len(params)} parameter sets, {numDays} observation days, '
+          f'reference error {goldenError:.1e}')
+    print(' Integrator   Step  Evaluations  Time [ms]  Max RMSE  '
+          'Median RMSE')
+    for result in sorted(results, key=lambda result: result['evaluations']):
+        mark = ('*' if result['pareto'] else ' ') \
+            + ('<' if result is chosen else ' ')
+        print(f"{result['integrator']:>11}  {result['step']:5g}  "
+              f"{result['evaluations']:11d}  {1e3 * result['time']:9.2f}  "
+              f"{result['maxError']:8.1e}  {result['medianError']:11.1e}  "
+              f'{mark}')
+    print(f"* Pareto optimal, < fastest with RMSE below "
+          f"{benchmarkConfig['tolerance']:g}")
+
+    return results
+
+
+def golden_trajectories(fitnessConfig: dict, params: np.ndarray,
+                        numDays: int, rtol: float, atol: float) -> np.ndarray:
+    """
+    Function that integrates the reference trajectories with an adaptive
+    solver of order 8
+
+    Parameters
+    ----------
+    fitnessConfig : dict
+        Configuration with the parameters of the fitness_function
+
+    params : np.ndarray (Bx5) [β ε σ ρ μ]
+        Parameters of each trajectory
+
+    numDays : int
+        Number of observation days
+
+    rtol : float
+        Relative tolerance of the solver
+
+    atol : float
+        Absolute tolerance of the solver
+
+    Returns
+    ----------
+    golden : np.ndarray (BxDx5) or (BxDxPx5) [S E I R D]
+        States at the beginning of each observation day
+
+    """
+    model = EPIDEMIC_MODELS[fitnessConfig['epidemicModel']]
+    if fitnessConfig.get('mobility') is not None:
+        model = partial(model, mobility=fitnessConfig['mobility'])
+
+    initialStates = np.asarray(fitnessConfig['initialStates'], dtype=float)
+    N = np.sum(initialStates, axis=-1)
+    days = 24.0 * np.arange(numDays)
+
+    golden = np.zeros((len(params), numDays) + initialStates.shape)
+    for i, paramsSet in enumerate(params):
+        solution = solve_ivp(
+            lambda t, states, p=paramsSet: model(
+                N, states.reshape(initialStates.shape), p).ravel(),
+            (0, days[-1]), initialStates.ravel(), method='DOP853',
+            t_eval=days, rtol=rtol, atol=atol)
+        golden[i] = solution.y.T.reshape((numDays,) + initialStates.shape)
+
+    return golden
+
+
+def load_golden(path: str, fitnessConfig: dict, params: np.ndarray,
+                numDays: int, rtol: float, atol: float) -> tuple:
+    """
+    Function that loads the cached reference trajectories, or integrates
+    and caches them if the model, the parameters or the tolerances
+    changed
+
+    Parameters
+    ----------
+    path : str
+        File of the cache
+
+    fitnessConfig : dict
+        Configuration with the parameters of the fitness_function
+
+    params : np.ndarray (Bx5) [β ε σ ρ μ]
+        Parameters of each trajectory
+
+    numDays : int
+        Number of observation days
+
+    rtol : float
+        Relative tolerance of the solver
+
+    atol : float
+        Absolute tolerance of the solver
+
+    Returns
+    ----------
+    golden : np.ndarray (BxDx5) or (BxDxPx5) [S E I R D]
+        States at the beginning of each observation day
+
+    goldenError : float
+        Largest difference with the trajectories integrated with ten
+        times the tolerances, as an estimation of their error
+
+    """
+    digest = hashlib.sha256(repr((fitnessConfig['epidemicModel'],
+                                  np.asarray(fitnessConfig['initialStates'],
+                                             dtype=float).tolist(),
+                                  params.tolist(), numDays, rtol,
+                                  atol)).encode())
+
+    hash_mobility(digest, fitnessConfig.get('mobility'))
+    key = digest.hexdigest()
+
+    if os.path.exists(path):
+        with np.load(path) as cacheFile:
+            if str(cacheFile['key']) == key:
+                return cacheFile['golden'], float(cacheFile['goldenError'])
+
+    golden = golden_trajectories(fitnessConfig, params, numDays, rtol, atol)
+    coarse = golden_trajectories(fitnessConfig, params, numDays, 10 * rtol,
+                                 10 * atol)
+    goldenError = float(np.max(np.abs(golden - coarse)))
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    np.savez(path, key=key, golden=golden, goldenError=goldenError)
+
+    return golden, goldenError
+
+
+def measure(fitnessConfig: dict, params: np.ndarray, golden: np.ndarray,
+            integrator: str, step: float, repeats: int) -> dict:
+    """
+    Function that measures the error and the cost of an integrator and
+    step
+
+    Parameters
+    ----------
+    fitnessConfig : dict
+        Configuration with the parameters of the fitness_function
+
+    params : np.ndarray (Bx5) [β ε σ ρ μ]
+        Parameters of each trajectory
+
+    golden : np.ndarray (BxDx5) or (BxDxPx5) [S E I R D]
+        Reference states at the beginning of each observation day
+
+    integrator : str
+        Name of the integrator in INTEGRATORS
+
+    step : float [h]
+        Time steps of the integration, a divisor of 24
+
+    repeats : int
+        Integrations timed, the fastest one is kept
+
+    Returns
+    ----------
+    result : dict
+        Integrator, step, evaluations of the model per trajectory,
+        time of the batch, and largest and median RMSE of the observed
+        compartments [I R D] over the parameters
+
+    """
+    numDays = golden.shape[1]
+
+    elapsed = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        dailyStates = get_curves_batch(fitnessConfig['epidemicModel'],
+                                       fitnessConfig['initialStates'],
+                                       params, numDays, step,
+                                       fitnessConfig.get('mobility'),
+                                       integrator=integrator)
+        elapsed.append(time.perf_counter() - start)
+
+    # Region-wise RMSE of each trajectory, as the fitness_function
+    with np.errstate(over='ignore', invalid='ignore'):
+        squaredErrors = (dailyStates[..., 2:] - golden[..., 2:])**2
+        rmse = np.sqrt(np.mean(squaredErrors, axis=(1, -1)))
+        rmse = np.mean(rmse.reshape(len(rmse), -1), axis=1)
+    rmse[~np.isfinite(rmse)] = np.inf
+
+    return {'integrator': integrator,
+            'step': step,
+            'evaluations': (int(numDays * 24 / step) - 1)
+            * evaluations_per_step(integrator),
+            'time': min(elapsed),
+            'maxError': float(np.max(rmse)),
+            'medianError': float(np.median(rmse))}
+
+
+def evaluations_per_step(integrator: str) -> int:
+    """
+    Function that counts the evaluations of the model of a step of an
+    integrator
+
+    Parameters
+    ----------
+    integrator : str
+        Name of the integrator in INTEGRATORS
+
+    Returns
+    ----------
+    evaluations : int
+        Evaluations of the model per step
+
+    """
+    evaluations = []
+
+    def model(N, states, params):
+        # pylint: disable=unused-argument
+        evaluations.append(1)
+        return states
+
+    INTEGRATORS[integrator](model, 1.0, np.ones(5), np.zeros(5), 1.0)
+
+    return len(evaluations)
+
+
+def pareto_front(results: list) -> None:
+    """
+    Function that marks the results that no other one improves in
+    evaluations, time and largest error at once
+
+    Parameters
+    ----------
+    results : list [dict]
+        Error and cost of each integrator and step, marked in place
+
+    Returns
+    ----------
+
+    """
+    costs = np.array([[result['evaluations'], result['time'],
+                       result['maxError']] for result in results])
+
+    for result, cost in zip(results, costs):
+        dominated = np.all(costs <= cost, axis=1) \
+            & np.any(costs < cost, axis=1)
+        result['pareto'] = not np.any(dominated)
+
+
+if __name__ == "__main__":
+    RESULTS = main()
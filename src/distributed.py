@@ -0,0 +1,592 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#    Epidemic Models - Calculates parameters of epidemic models
+#    Copyright (C) 2020 Carlos Moreno
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#    See LICENSE
+
+"""
+Distributed evaluation library
+
+A coordinator listens on TCP for workers, which may run on other nodes
+(python distributed.py) or on this machine. Batches of chromosomes are
+sent to the idle workers, sized from the throughput measured on each of
+them, and the batches of lost or timed out workers are sent again.
+
+The connections are authenticated with a key shared by the coordinator
+and the workers, the authkey of the configuration or the environment
+variable EPIDEMIC_MODELS_AUTHKEY, and carry pickled messages, so they
+are meant for a trusted network. An error of the evaluated function on
+a worker is raised by the coordinator with the traceback of the worker.
+
+"""
+
+#######################################################################
+# Imports area
+#######################################################################
+
+# Generic / Built-in
+from multiprocessing import Process
+from multiprocessing.connection import (AuthenticationError, Client,
+                                        Listener, wait)
+import itertools
+import os
+import threading
+import time
+import traceback
+
+# Other Libs
+import numpy as np
+import toml
+
+
+# Own Libs
+
+
+#######################################################################
+
+
+class Coordinator():
+    """
+    Class to represent the coordinator of the distributed evaluation.
+
+    Attributes
+    ----------
+    address : tuple (str, int)
+        Address where the workers connect
+
+    batchSeconds : float
+        Expected duration of a batch on a worker
+
+    costModel : function
+        Estimation of the relative cost of each chromosome, uniform if
+        None
+
+    settings : dict
+        Seconds without answer before a worker is considered lost
+        (timeout), times a chromosome is sent again after a lost worker
+        (retries) and expected seconds of a batch (batchSeconds)
+
+
+    Methods
+    ----------
+    close()
+        Stop the workers and the listener
+
+    setup(function, fitnessConfig)
+        Set the batched function evaluated by the workers
+
+    """
+    def __init__(self, address: tuple, authkey: bytes, timeout=60.0,
+                 retries=3, batchSeconds=0.5, costModel=None,
+                 localWorkers=0):
+        """
+        Constructor of a coordinator, which starts listening.
+
+        Parameters
+        ----------
+        address : tuple (str, int)
+            Address where the workers connect, port 0 for any free one
+
+        authkey : bytes
+            Key shared with the workers
+
+        timeout : float [s]
+            Time without answer of a worker before it is considered lost
+
+        retries : int
+            Times a chromosome is sent again after a lost worker
+
+        batchSeconds : float [s]
+            Expected duration of a batch on a worker
+
+        costModel : function, optional
+            Estimation of the relative cost of each chromosome
+
+        localWorkers : int
+            Workers started on this machine
+
+        Returns
+        ----------
+
+        """
+        self.settings = {'timeout': timeout, 'retries': retries,
+                         'batchSeconds': batchSeconds}
+        self.costModel = costModel
+
+        self._listener = Listener(address, authkey=authkey)
+        self.address = self._listener.address
+        self._closed = False
+        self._lock = threading.Lock()
+        self._newConnections = []
+        self._workers = []
+        self._setup = None
+        self._taskIds = itertools.count()
+
+        threading.Thread(target=self._accept, daemon=True).start()
+
+        self._localWorkers = spawn_local_workers(self.address, authkey,
+                                                 localWorkers)
+
+    def setup(self, function, fitnessConfig: dict) -> None:
+        """
+        Sets the batched function evaluated by the workers, sent to each
+        of them before its first batch.
+
+        Parameters
+        ----------
+        function : function
+            Batched function evaluated, importable by the workers
+
+        fitnessConfig : dict
+            Configuration with the parameters of the fitness_function
+
+        Returns
+        ----------
+
+        """
+        self._setup = ('setup', function, fitnessConfig)
+
+        for worker in list(self._workers):
+            self._send(worker, self._setup)
+
+    def __call__(self, chromosomes: np.ndarray, dtype) -> np.ndarray:
+        """
+        Evaluates the chromosomes on the workers.
+
+        Parameters
+        ----------
+        chromosomes : np.ndarray (BxN) [float]
+            Parameters to evaluate
+
+        dtype : np.dtype
+            Floating point type of the integrations
+
+        Returns
+        ----------
+        scores : np.ndarray (B x ...) [float]
+            Evaluation of each chromosome
+
+        """
+        if len(chromosomes) == 0:
+            return np.zeros(0)
+
+        costs = np.ones(len(chromosomes)) if self.costModel is None \
+            else np.asarray(self.costModel(chromosomes), dtype=float)
+
+        # Tasks left running by an error are abandoned, their answers are
+        # told apart by their older ids
+        try:
+            results = self._collect(chromosomes, costs, dtype)
+        finally:
+            for worker in self._workers:
+                worker['task'] = None
+
+        # The answers may hold several scores per chromosome
+        scores = np.full((len(chromosomes),) + np.shape(results[0][1])[1:],
+                         np.nan)
+        for indices, batchScores in results:
+            scores[indices] = batchScores
+
+        return scores
+
+    def close(self) -> None:
+        """
+        Stops the workers and the listener.
+
+        Parameters
+        ----------
+
+        Returns
+        ----------
+
+        """
+        self._closed = True
+        self._adopt_workers()
+
+        for worker in list(self._workers):
+            self._send(worker, ('stop',))
+            self._drop(worker)
+
+        self._listener.close()
+
+        for process in self._localWorkers:
+            process.join(timeout=self.settings['timeout'])
+
+    def _collect(self, chromosomes: np.ndarray, costs: np.ndarray,
+                 dtype) -> list:
+        """
+        Sends the chromosomes in batches to the idle workers, until the
+        answers of all of them are received.
+
+        Parameters
+        ----------
+        chromosomes : np.ndarray (BxN) [float]
+            Parameters to evaluate
+
+        costs : np.ndarray (B) [float]
+            Estimated cost of each chromosome
+
+        dtype : np.dtype
+            Floating point type of the integrations
+
+        Returns
+        ----------
+        results : list [(np.ndarray, np.ndarray)]
+            Indices and scores of the batches received
+
+        """
+        results = []
+        attempts = np.zeros(len(chromosomes), dtype=int)
+        done = np.zeros(len(chromosomes), dtype=bool)
+
+        # The most expensive chromosomes are sent first
+        remaining = list(np.argsort(-costs, kind='stable'))
+        lastProgress = time.monotonic()
+
+        while not np.all(done):
+            self._adopt_workers()
+
+            for worker in self._workers:
+                if worker['task'] is None and remaining:
+                    self._assign(worker, remaining, chromosomes, costs, dtype)
+
+            busyWorkers = [worker for worker in self._workers
+                           if worker['task'] is not None]
+            if not busyWorkers:
+                if time.monotonic() - lastProgress \
+                        > self.settings['timeout']:
+                    raise RuntimeError('No workers available')
+                time.sleep(0.05)
+                continue
+
+            ready = wait([worker['connection'] for worker in busyWorkers],
+                         timeout=0.1)
+
+            for worker in busyWorkers:
+                if worker['connection'] in ready:
+                    received = self._receive(worker, results, costs)
+                    if received:
+                        done[worker['task'][1]] = True
+                        worker['task'] = None
+                        lastProgress = time.monotonic()
+                    if received is not False:
+                        continue
+                elif time.monotonic() < worker['task'][2]:
+                    continue
+
+                # Lost or timed out worker, its batch is sent again
+                indices = worker['task'][1]
+                attempts[indices] += 1
+                if np.any(attempts[indices] > self.settings['retries']):
+                    raise RuntimeError('Chromosomes failed after '
+                                       f"{self.settings['retries']} retries")
+                remaining[:0] = list(indices)
+                self._drop(worker)
+
+        return results
+
+    def _accept(self) -> None:
+        """
+        Accepts the connections of the workers, in a background thread.
+
+        Parameters
+        ----------
+
+        Returns
+        ----------
+
+        """
+        while not self._closed:
+            try:
+                connection = self._listener.accept()
+            except AuthenticationError:
+                continue
+            except OSError:
+                return
+
+            with self._lock:
+                self._newConnections.append(connection)
+
+    def _adopt_workers(self) -> None:
+        """
+        Registers the workers connected since the last call.
+
+        Parameters
+        ----------
+
+        Returns
+        ----------
+
+        """
+        with self._lock:
+            connections, self._newConnections = self._newConnections, []
+
+        for connection in connections:
+            worker = {'connection': connection, 'rate': None, 'task': None}
+            self._workers.append(worker)
+
+            if self._setup is not None:
+                self._send(worker, self._setup)
+
+    def _assign(self, worker: dict, remaining: list, chromosomes: np.ndarray,
+                costs: np.ndarray, dtype) -> None:
+        """
+        Sends a batch to an idle worker, with the cost it evaluates in
+        batchSeconds or, while its rate is unknown, a fraction of the
+        chromosomes left.
+
+        Parameters
+        ----------
+        worker : dict
+            Connection, measured rate and current task of the worker
+
+        remaining : list [int]
+            Indices of the chromosomes not sent yet
+
+        chromosomes : np.ndarray (BxN) [float]
+            Parameters to evaluate
+
+        costs : np.ndarray (B) [float]
+            Estimated cost of each chromosome
+
+        dtype : np.dtype
+            Floating point type of the integrations
+
+        Returns
+        ----------
+
+        """
+        if worker['rate'] is None:
+            numBatch = max(1, len(remaining) // (4 * len(self._workers)))
+        else:
+            numBatch = max(1, int(np.searchsorted(
+                np.cumsum(costs[remaining]),
+                worker['rate'] * self.settings['batchSeconds'],
+                side='right')))
+
+        indices = np.array(remaining[:numBatch])
+        del remaining[:numBatch]
+
+        taskId = next(self._taskIds)
+        worker['task'] = (taskId, indices,
+                          time.monotonic() + self.settings['timeout'])
+
+        self._send(worker, ('evaluate', taskId, chromosomes[indices],
+                            np.dtype(dtype).str))
+
+    def _receive(self, worker: dict, results: list,
+                 costs: np.ndarray) -> bool:
+        """
+        Receives the answer of a worker and updates its rate, or raises
+        the error of the evaluated function on the worker.
+
+        Parameters
+        ----------
+        worker : dict
+            Connection, measured rate and current task of the worker
+
+        results : list [(np.ndarray, np.ndarray)]
+            Indices and scores of the batches received, appended
+
+        costs : np.ndarray (B) [float]
+            Estimated cost of each chromosome
+
+        Returns
+        ----------
+        received : bool
+            False if the worker is lost, None if the answer was of a task
+            abandoned after an error
+
+        """
+        taskId, indices, _ = worker['task']
+
+        try:
+            answer = worker['connection'].recv()
+        except (EOFError, OSError):
+            return False
+
+        # Answer of a task abandoned after an error
+        if answer[1] < taskId:
+            return None
+        if answer[1] != taskId:
+            return False
+
+        if answer[0] == 'error':
+            raise RuntimeError(f'Evaluation failed on a worker:\n{answer[2]}')
+
+        _, _, batchScores, elapsed = answer
+
+        results.append((indices, batchScores))
+
+        # Exponential average of the cost evaluated per second
+        rate = np.sum(costs[indices]) / max(elapsed, 1e-6)
+        worker['rate'] = rate if worker['rate'] is None \
+            else 0.5 * worker['rate'] + 0.5 * rate
+
+        return True
+
+    def _send(self, worker: dict, message: tuple) -> None:
+        """
+        Sends a message to a worker, which times out if it fails.
+
+        Parameters
+        ----------
+        worker : dict
+            Connection, measured rate and current task of the worker
+
+        message : tuple
+            Message to send
+
+        Returns
+        ----------
+
+        """
+        try:
+            worker['connection'].send(message)
+        except OSError:
+            if worker['task'] is not None:
+                worker['task'] = worker['task'][:2] + (0,)
+
+    def _drop(self, worker: dict) -> None:
+        """
+        Closes the connection of a worker and forgets it.
+
+        Parameters
+        ----------
+        worker : dict
+            Connection, measured rate and current task of the worker
+
+        Returns
+        ----------
+
+        """
+        worker['connection'].close()
+        self._workers.remove(worker)
+
+
+def run_worker(address: tuple, authkey: bytes) -> None:
+    """
+    Worker that evaluates the batches of a coordinator until it stops
+
+    Parameters
+    ----------
+    address : tuple (str, int)
+        Address of the coordinator
+
+    authkey : bytes
+        Key shared with the coordinator
+
+    Returns
+    ----------
+
+    """
+    # Function and configuration sent by the coordinator
+    setup = {}
+
+    with Client(address, authkey=authkey) as connection:
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                return
+
+            if message[0] == 'setup':
+                _, setup['function'], setup['fitnessConfig'] = message
+            elif message[0] == 'evaluate':
+                _, taskId, params, dtype = message
+                start = time.perf_counter()
+                # The coordinator raises the errors, the worker goes on
+                try:
+                    answer = ('scores', taskId,
+                              setup['function'](params=params,
+                                                dtype=np.dtype(dtype),
+                                                **setup['fitnessConfig']),
+                              time.perf_counter() - start)
+                except Exception:  # pylint: disable=broad-except
+                    answer = ('error', taskId, traceback.format_exc())
+
+                # The coordinator drops the workers that time out
+                try:
+                    connection.send(answer)
+                except OSError:
+                    return
+            else:
+                return
+
+
+def get_authkey(config: dict) -> bytes:
+    """
+    Key shared by the coordinator and the workers, from the configuration
+    or the environment variable EPIDEMIC_MODELS_AUTHKEY
+
+    Parameters
+    ----------
+    config : dict
+        Configuration of the distributed evaluation
+
+    Returns
+    ----------
+    authkey : bytes
+        Key shared by the coordinator and the workers
+
+    """
+    authkey = config.get('authkey') \
+        or os.environ.get('EPIDEMIC_MODELS_AUTHKEY')
+    if not authkey:
+        raise ValueError('The distributed evaluation needs an authkey in '
+                         'the configuration or in EPIDEMIC_MODELS_AUTHKEY')
+
+    return authkey.encode()
+
+
+def spawn_local_workers(address: tuple, authkey: bytes,
+                        numWorkers: int) -> list:
+    """
+    Starts workers on this machine, as a stand-in of the remote nodes
+
+    Parameters
+    ----------
+    address : tuple (str, int)
+        Address of the coordinator
+
+    authkey : bytes
+        Key shared with the coordinator
+
+    numWorkers : int
+        Number of workers
+
+    Returns
+    ----------
+    processes : list [multiprocessing.Process]
+        Processes of the workers
+
+    """
+    processes = [Process(target=run_worker, args=(address, authkey),
+                         daemon=True)
+                 for _ in range(numWorkers)]
+
+    for process in processes:
+        process.start()
+
+    return processes
+
+
+if __name__ == "__main__":
+    CONFIG = toml.load('../config/configuration.toml',
+                       _dict=dict)['distributed']
+    run_worker((CONFIG['host'], CONFIG['port']), get_authkey(CONFIG))
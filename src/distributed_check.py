@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#    Epidemic Models - Calculates parameters of epidemic models
+#    Copyright (C) 2020 Carlos Moreno
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#    See LICENSE
+
+"""
+Check of the distributed evaluation on localhost
+
+A coordinator on a free port of this machine evaluates random
+chromosomes on local workers, and the scores are compared with the ones
+of this process. Then an empty batch, an error of the evaluated
+function, a worker that exits and a worker that stops answering are
+checked: the coordinator must raise the error, send the batches of the
+lost workers again and go on with the workers left.
+
+"""
+
+#######################################################################
+# Imports area
+#######################################################################
+
+# Generic / Built-in
+from functools import partial
+import os
+import tempfile
+import time
+
+# Other Libs
+import numpy as np
+import toml
+
+# Own Libs
+from distributed import Coordinator
+from evaluator import Evaluator, batch_fitness
+from main import load_fitness_config
+
+#######################################################################
+
+
+def main():
+    """
+    Main program to check the distributed evaluation
+
+    Parameters
+    ----------
+
+    Returns
+    ----------
+
+    """
+    config = toml.load('../config/configuration.toml', _dict=dict)
+    populationConfig = config['population']
+    fitnessConfig = load_fitness_config(config)
+    fitnessConfig = {key: value for key, value in fitnessConfig.items()
+                     if key != 'params'}
+
+    numGenes = populationConfig['num_genes']
+    minValues = np.broadcast_to(populationConfig['min_values'], numGenes)
+    maxValues = np.broadcast_to(populationConfig['max_values'], numGenes)
+    chromosomes = minValues + np.random.default_rng(0).random(
+        (64, numGenes)) * (maxValues - minValues)
+
+    timeout = 5.0
+    coordinator = Coordinator(('127.0.0.1', 0), os.urandom(16), timeout,
+                              batchSeconds=0.05, localWorkers=3)
+    try:
+        coordinator.setup(batch_fitness, fitnessConfig)
+        scores = coordinator(chromosomes, np.float64)
+        expected = batch_fitness(params=chromosomes, **fitnessConfig)
+        assert np.allclose(scores, expected, equal_nan=True), \
+            'Distributed scores differ from the local ones'
+        print(f'{len(chromosomes)} chromosomes scored on the workers')
+
+        assert coordinator(chromosomes[:0], np.float64).shape == (0,)
+        assert Evaluator(fitnessConfig)(chromosomes[:0]).shape == (0,)
+        print('Empty batch')
+
+        coordinator.setup(batch_fitness, {**fitnessConfig,
+                                          'integrator': 'missing'})
+        try:
+            coordinator(chromosomes, np.float64)
+        except RuntimeError as error:
+            assert 'KeyError' in str(error), str(error)
+            print('Error of a worker raised with its traceback')
+        else:
+            raise AssertionError('The error of the workers was not raised')
+
+        coordinator.setup(batch_fitness, fitnessConfig)
+        assert np.allclose(coordinator(chromosomes, np.float64), expected,
+                           equal_nan=True)
+        print('Workers available after the error')
+
+        # The first worker that evaluates a batch exits, and then the
+        # next one sleeps past the timeout
+        for failure, message in ((_exit_once, 'Lost worker'),
+                                 (partial(_sleep_once, 2 * timeout),
+                                  'Timed out worker')):
+            with tempfile.TemporaryDirectory() as directory:
+                coordinator.setup(partial(failure, os.path.join(directory,
+                                                                'failed')),
+                                  fitnessConfig)
+                assert np.allclose(coordinator(chromosomes, np.float64),
+                                   expected, equal_nan=True)
+            print(f'{message}, its batch sent again')
+    finally:
+        coordinator.close()
+
+
+def _exit_once(path: str, **fitnessConfig) -> np.ndarray:
+    """
+    batch_fitness, but the worker that creates the file exits
+
+    Parameters
+    ----------
+    path : str
+        File created by the first call of all the workers
+
+    **fitnessConfig
+        Arguments of batch_fitness
+
+    Returns
+    ----------
+    cost : np.ndarray (B) [float]
+        Evaluation of the cost function of each set of parameters
+
+    """
+    if _first_call(path):
+        os._exit(1)  # pylint: disable=protected-access
+
+    return batch_fitness(**fitnessConfig)
+
+
+def _sleep_once(seconds: float, path: str, **fitnessConfig) -> np.ndarray:
+    """
+    batch_fitness, but the worker that creates the file sleeps first
+
+    Parameters
+    ----------
+    seconds : float [s]
+        Time slept by the first call of all the workers
+
+    path : str
+        File created by the first call of all the workers
+
+    **fitnessConfig
+        Arguments of batch_fitness
+
+    Returns
+    ----------
+    cost : np.ndarray (B) [float]
+        Evaluation of the cost function of each set of parameters
+
+    """
+    if _first_call(path):
+        time.sleep(seconds)
+
+    return batch_fitness(**fitnessConfig)
+
+
+def _first_call(path: str) -> bool:
+    """
+    Whether this is the first call of all the workers, which creates the
+    file
+
+    Parameters
+    ----------
+    path : str
+        File created by the first call
+
+    Returns
+    ----------
+    first : bool
+        True if the file did not exist
+
+    """
+    try:
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL))
+    except FileExistsError:
+        return False
+
+    return True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,541 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#    Epidemic Models - Calculates parameters of epidemic models
+#    Copyright (C) 2020 Carlos Moreno
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#    See LICENSE
+
+"""
+Batched evaluation library
+
+Integrates many sets of parameters at once, vectorising the epidemic
+model over a leading batch dimension, and splits large batches in
+chunks that are evaluated in this process, in a pool of processes or
+on the workers of a distributed coordinator.
+The integration can run in float32 to halve the working set of large
+batches, with the errors accumulated in float64.
+
+"""
+
+#######################################################################
+# Imports area
+#######################################################################
+
+# Generic / Built-in
+from functools import partial
+from multiprocessing import Pool
+import warnings
+
+# Other Libs
+import numpy as np
+
+
+# Own Libs
+from distributed import Coordinator, get_authkey
+from models import EPIDEMIC_MODELS
+from integrators import INTEGRATORS
+from losses import LOSSES, evaluate_losses
+
+#######################################################################
+
+# Configuration of each worker process of the pool, filled by _init_worker
+_WORKER = {}
+
+
+def get_curves_batch(epidemicModel: str, initialStates: list,
+                     params: np.ndarray, period: float, step: float,
+                     mobility=None, dtype=np.float64,
+                     integrator='rk4') -> np.ndarray:
+    """
+    Function that obtain the daily states of a batch of integrations
+
+    Parameters
+    ----------
+    epidemicModel : function
+        Epidemic model
+
+    initialStates : np.ndarray (5) or (Px5) [S E I R D]
+        Initial states of the population, or of each of the P patches
+
+    params : np.ndarray (Bx5) [β ε σ ρ μ]
+        Parameters of each integration. See README
+
+    period : float [day]
+        Duration of the integration
+
+    step : float [h]
+        Time steps of the integration
+
+    mobility : scipy.sparse.csr_matrix (PxP), optional
+        Mobility matrix coupling the patches of a metapopulation model
+
+    dtype : np.dtype
+        Floating point type of the integration
+
+    integrator : str
+        Name of the integrator in INTEGRATORS
+
+    Returns
+    ----------
+    dailyStates : np.ndarray (BxDx5) or (BxDxPx5) [S E I R D]
+        States at the beginning of each day of every integration
+
+    """
+    # Epidemic model chosen
+    model = EPIDEMIC_MODELS[epidemicModel]
+    if mobility is not None:
+        model = partial(model, mobility=mobility.astype(dtype))
+
+    # Integrator chosen
+    integrate = INTEGRATORS[integrator]
+
+    initialStates = np.asarray(initialStates, dtype=dtype)
+    params = np.asarray(params, dtype=dtype)
+    N = np.sum(initialStates, axis=-1)
+    n = int(period * 24 / step)
+    stepsDay = int(24 / step)
+
+    # Only the daily states are kept, as get_curves(...)[::stepsDay]
+    states = np.repeat(initialStates[None], len(params), axis=0)
+    dailyStates = np.zeros((len(range(0, n, stepsDay)),) + states.shape,
+                           dtype=dtype)
+
+    for i in range(n):
+        if i % stepsDay == 0:
+            dailyStates[i // stepsDay] = states
+
+        if i < n - 1:
+            states = integrate(model, N, states, params, step)
+
+    return np.moveaxis(dailyStates, 0, 1)
+
+
+def batch_fitness(epidemicModel: str, initialStates: list, params: np.ndarray,
+                  period: float, step: float, realData: np.ndarray,
+                  mobility=None, dtype=np.float64, integrator='rk4',
+                  lossOptions=None) -> np.ndarray:
+    """
+    Function that evaluates the fitness_function of a batch of
+    parameters with a single vectorised integration
+
+    Parameters
+    ----------
+    epidemicModel : function
+        Epidemic model
+
+    initialStates : np.ndarray (5) or (Px5) [S E I R D]
+        Initial states of the population, or of each of the P patches
+
+    params : np.ndarray (Bx5) [β ε σ ρ μ]
+        Parameters of each integration. See README
+
+    period : float [day]
+        Duration of the integration
+
+    step : float [h]
+        Time steps of the integration
+
+    realData : np.ndarray (Dx3) or (DxPx3) [I R D]
+        Observed daily cases, of the population or of each patch
+
+    mobility : scipy.sparse.csr_matrix (PxP), optional
+        Mobility matrix coupling the patches of a metapopulation model
+
+    dtype : np.dtype
+        Floating point type of the integration
+
+    integrator : str
+        Name of the integrator in INTEGRATORS
+
+    lossOptions : dict, optional
+        Loss of the fitness function (loss), 'rmse' if missing, and its
+        options, see evaluate_losses
+
+    Returns
+    ----------
+    cost : np.ndarray (B) [float]
+        Evaluation of the cost function of each set of parameters
+
+    """
+    lossOptions = lossOptions or {}
+    simDataIRD = get_curves_batch(epidemicModel, initialStates, params,
+                                  period, step, mobility, dtype,
+                                  integrator)[..., 2:]
+
+    return evaluate_losses(simDataIRD, realData,
+                           [lossOptions.get('loss', 'rmse')],
+                           lossOptions)[:, 0]
+
+
+def batch_losses(epidemicModel: str, initialStates: list, params: np.ndarray,
+                 period: float, step: float, realData: np.ndarray,
+                 mobility=None, dtype=np.float64, integrator='rk4',
+                 lossOptions=None) -> np.ndarray:
+    """
+    Function that evaluates several losses of a batch of parameters with
+    a single vectorised integration. An Evaluator with this function
+    returns the matrix of the losses of its chromosomes
+
+    Parameters
+    ----------
+    epidemicModel : function
+        Epidemic model
+
+    initialStates : np.ndarray (5) or (Px5) [S E I R D]
+        Initial states of the population, or of each of the P patches
+
+    params : np.ndarray (Bx5) [β ε σ ρ μ]
+        Parameters of each integration. See README
+
+    period : float [day]
+        Duration of the integration
+
+    step : float [h]
+        Time steps of the integration
+
+    realData : np.ndarray (Dx3) or (DxPx3) [I R D]
+        Observed daily cases, of the population or of each patch
+
+    mobility : scipy.sparse.csr_matrix (PxP), optional
+        Mobility matrix coupling the patches of a metapopulation model
+
+    dtype : np.dtype
+        Floating point type of the integration
+
+    integrator : str
+        Name of the integrator in INTEGRATORS
+
+    lossOptions : dict, optional
+        Losses evaluated (losses), all the LOSSES if missing, and their
+        options, see evaluate_losses
+
+    Returns
+    ----------
+    losses : np.ndarray (BxL) [float]
+        Evaluation of each loss of each set of parameters
+
+    """
+    lossOptions = lossOptions or {}
+    simDataIRD = get_curves_batch(epidemicModel, initialStates, params,
+                                  period, step, mobility, dtype,
+                                  integrator)[..., 2:]
+
+    return evaluate_losses(simDataIRD, realData,
+                           lossOptions.get('losses', list(LOSSES)),
+                           lossOptions)
+
+
+class Evaluator():
+    """
+    Class to represent a batched evaluator of the fitness function.
+
+    Attributes
+    ----------
+    backend : str
+        Where the chunks are evaluated, 'batch' for this process,
+        'process' for a pool of processes or 'distributed' for the
+        workers of a coordinator
+
+    distributed : dict
+        Configuration of the coordinator of the 'distributed' backend
+
+    chunkSize : int
+        Maximum number of parameters integrated at once
+
+    costModel : function
+        Estimation of the relative cost of each chromosome, used by the
+        'distributed' backend to size the batches, uniform if None
+
+    fitnessConfig : dict
+        Configuration with the parameters of the fitness_function
+
+    function : function
+        Batched function evaluated, batch_fitness by default, or
+        batch_losses for the (BxL) matrix of the losses
+
+    precision : str
+        Floating point type of the integrations, 'float64' or 'float32'
+
+    processes : int
+        Number of processes of the pool, all the CPUs if 0
+
+
+    Methods
+    ----------
+    close()
+        Terminate the pool of processes or the coordinator, if any
+
+    rescore(chromosomes, scores, tolerance)
+        Evaluate again in float64 chromosomes scored in lower precision
+
+    """
+    def __init__(self, fitnessConfig: dict, backend='batch', processes=0,
+                 chunkSize=256, function=batch_fitness, precision='float64',
+                 distributed=None, costModel=None):
+        """
+        Constructor of an evaluator.
+
+        Parameters
+        ----------
+        fitnessConfig : dict
+            Configuration with the parameters of the fitness_function
+
+        backend : str
+            Where the chunks are evaluated, 'batch', 'process' or
+            'distributed'
+
+        processes : int
+            Number of processes of the pool, all the CPUs if 0
+
+        chunkSize : int
+            Maximum number of parameters integrated at once
+
+        function : function
+            Batched function evaluated, batch_fitness by default, or
+            batch_losses for the (BxL) matrix of the losses
+
+        precision : str
+            Floating point type of the integrations, 'float64' or
+            'float32'
+
+        distributed : dict, optional
+            Configuration of the coordinator, required by the
+            'distributed' backend
+
+        costModel : function, optional
+            Estimation of the relative cost of each chromosome, used by
+            the 'distributed' backend
+
+        Returns
+        ----------
+
+        """
+        self.fitnessConfig = {key: value for key, value in
+                              fitnessConfig.items() if key != 'params'}
+        self.backend = backend
+        self.processes = processes
+        self.chunkSize = chunkSize
+        self.function = function
+        self.precision = precision
+        self.distributed = distributed
+        self.costModel = costModel
+        self._pool = None
+        self._coordinator = None
+
+    def __call__(self, chromosomes: np.ndarray, precision=None) -> np.ndarray:
+        """
+        Evaluates a batch of chromosomes.
+
+        Parameters
+        ----------
+        chromosomes : np.ndarray (BxN) [float]
+            Parameters to evaluate
+
+        precision : str, optional
+            Floating point type of the integrations, by default the one
+            of the evaluator
+
+        Returns
+        ----------
+        scores : np.ndarray (B) or (BxL) [float]
+            Evaluation of each chromosome
+
+        """
+        if len(chromosomes) == 0:
+            return np.zeros(0)
+
+        backendDict = {'batch': self._evaluate_batch,
+                       'process': self._evaluate_process,
+                       'distributed': self._evaluate_distributed}
+
+        dtype = np.dtype(precision or self.precision)
+        chromosomes = np.asarray(chromosomes, dtype=float)
+        chunks = [(chromosomes[i:i + self.chunkSize], dtype)
+                  for i in range(0, len(chromosomes), self.chunkSize)]
+
+        return np.concatenate(backendDict[self.backend](chunks))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        """
+        Terminates the pool of processes or the coordinator, if any.
+
+        Parameters
+        ----------
+
+        Returns
+        ----------
+
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+        if self._coordinator is not None:
+            self._coordinator.close()
+            self._coordinator = None
+
+    def rescore(self, chromosomes: np.ndarray, scores: np.ndarray,
+                tolerance: float) -> np.ndarray:
+        """
+        Evaluates again in float64 chromosomes scored with the precision
+        of the evaluator, warning if the scores differ too much.
+
+        Parameters
+        ----------
+        chromosomes : np.ndarray (BxN) [float]
+            Parameters to evaluate
+
+        scores : np.ndarray (B) [float]
+            Scores obtained with the precision of the evaluator
+
+        tolerance : float
+            Relative difference of the scores allowed
+
+        Returns
+        ----------
+        scores : np.ndarray (B) [float]
+            Evaluation of each chromosome in float64
+
+        """
+        reference = self(chromosomes, 'float64')
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            discrepancy = np.abs(scores - reference) / np.abs(reference)
+        discrepancy = discrepancy[~np.isnan(discrepancy)]
+
+        if discrepancy.size and np.max(discrepancy) > tolerance:
+            warnings.warn(f'Scores in {self.precision} differ up to '
+                          f'{np.max(discrepancy):.2e} from float64')
+
+        return reference
+
+    def _evaluate_batch(self, chunks: list) -> list:
+        """
+        Evaluates the chunks in this process.
+
+        Parameters
+        ----------
+        chunks : list [(np.ndarray (BxN), np.dtype)]
+            Chunks of chromosomes and precision of their integration
+
+        Returns
+        ----------
+        scores : list [np.ndarray (B)]
+            Evaluation of each chunk
+
+        """
+        return [self.function(params=chunk, dtype=dtype, **self.fitnessConfig)
+                for chunk, dtype in chunks]
+
+    def _evaluate_process(self, chunks: list) -> list:
+        """
+        Evaluates the chunks in the pool of processes, which keeps the
+        configuration loaded between calls.
+
+        Parameters
+        ----------
+        chunks : list [(np.ndarray (BxN), np.dtype)]
+            Chunks of chromosomes and precision of their integration
+
+        Returns
+        ----------
+        scores : list [np.ndarray (B)]
+            Evaluation of each chunk
+
+        """
+        if self._pool is None:
+            self._pool = Pool(self.processes or None,
+                              initializer=_init_worker,
+                              initargs=(self.function, self.fitnessConfig))
+
+        return self._pool.map(_evaluate_chunk, chunks)
+
+    def _evaluate_distributed(self, chunks: list) -> list:
+        """
+        Evaluates the chunks on the workers of the coordinator, which
+        splits them again in batches sized for each worker.
+
+        Parameters
+        ----------
+        chunks : list [(np.ndarray (BxN), np.dtype)]
+            Chunks of chromosomes and precision of their integration
+
+        Returns
+        ----------
+        scores : list [np.ndarray (B)]
+            Evaluation of all the chunks
+
+        """
+        if self._coordinator is None:
+            config = self.distributed
+            self._coordinator = Coordinator(
+                (config['host'], config['port']), get_authkey(config),
+                config['timeout'], config['retries'],
+                config['batch_seconds'], costModel=self.costModel,
+                localWorkers=config['local_workers'])
+            self._coordinator.setup(self.function, self.fitnessConfig)
+
+        return [self._coordinator(np.concatenate([chunk for chunk, _ in
+                                                  chunks]), chunks[0][1])]
+
+
+def _init_worker(function, fitnessConfig: dict) -> None:
+    """
+    Initialiser of the worker processes of the evaluator
+
+    Parameters
+    ----------
+    function : function
+        Batched function evaluated
+
+    fitnessConfig : dict
+        Configuration with the parameters of the fitness_function
+
+    Returns
+    ----------
+
+    """
+    _WORKER['function'] = function
+    _WORKER['fitnessConfig'] = fitnessConfig
+
+
+def _evaluate_chunk(chunk: tuple) -> np.ndarray:
+    """
+    Evaluates a chunk of chromosomes in a worker process
+
+    Parameters
+    ----------
+    chunk : (np.ndarray (BxN), np.dtype)
+        Chromosomes to evaluate and precision of their integration
+
+    Returns
+    ----------
+    scores : np.ndarray (B) [float]
+        Evaluation of each chromosome
+
+    """
+    params, dtype = chunk
+
+    return _WORKER['function'](params=params, dtype=dtype,
+                               **_WORKER['fitnessConfig'])
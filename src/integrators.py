@@ -22,6 +22,9 @@
 """
 Integrators library
 
+All the integrators take the same arguments, so they are interchangeable
+through INTEGRATORS.
+
 """
 
 #######################################################################
@@ -41,10 +44,71 @@ import numpy as np
 #######################################################################
 
 
+def euler(epidemicModel, N: int, states: np.ndarray, params: np.ndarray,
+          step: float) -> np.ndarray:
+    """
+    Explicit method of Euler, first order with one evaluation per step
+
+    Parameters
+    ----------
+    epidemicModel : function
+        Epidemic model
+
+    states : np.ndarray (5) [S E I R D]
+        Different states of the population. See README
+
+    params : np.ndarray (5) [β ε σ ρ μ]
+        Parameters of the model. See README
+
+    step : float [h]
+        Time step implemented
+
+    Returns
+    ----------
+    statesNext : np.ndarray (5) [S E I R D]
+        Next temporal states, as a result of the numerical integration
+
+    """
+    return states + step * epidemicModel(N, states, params)
+
+
+def heun(epidemicModel, N: int, states: np.ndarray, params: np.ndarray,
+         step: float) -> np.ndarray:
+    """
+    Method of Heun, second order with two evaluations per step
+
+    Parameters
+    ----------
+    epidemicModel : function
+        Epidemic model
+
+    states : np.ndarray (5) [S E I R D]
+        Different states of the population. See README
+
+    params : np.ndarray (5) [β ε σ ρ μ]
+        Parameters of the model. See README
+
+    step : float [h]
+        Time step implemented
+
+    Returns
+    ----------
+    statesNext : np.ndarray (5) [S E I R D]
+        Next temporal states, as a result of the numerical integration
+
+    """
+    states1 = epidemicModel(N, states, params)
+    states2 = epidemicModel(N, states + step * states1, params)
+
+    return states + 1/2 * step * (states1 + states2)
+
+
 def runge_kutta_4(epidemicModel, N: int, states: np.ndarray,
                   params: np.ndarray, step: float) -> np.ndarray:
     """
-    Method of Runge-Kutta 4
+    Method of Runge-Kutta 4, as used by the fits so far. Its fourth
+    evaluation is taken at half step, which makes it first order, so
+    classic_runge_kutta_4 is more accurate with the same cost
 
     Parameters
     ----------
@@ -79,3 +143,43 @@ def runge_kutta_4(epidemicModel, N: int, states: np.ndarray,
 
     # Return next state
     return statesNext
+
+
+def classic_runge_kutta_4(epidemicModel, N: int, states: np.ndarray,
+                          params: np.ndarray, step: float) -> np.ndarray:
+    """
+    Classic method of Runge-Kutta 4, fourth order with four evaluations
+    per step
+
+    Parameters
+    ----------
+    epidemicModel : function
+        Epidemic model
+
+    states : np.ndarray (5) [S E I R D]
+        Different states of the population. See README
+
+    params : np.ndarray (5) [β ε σ ρ μ]
+        Parameters of the model. See README
+
+    step : float [h]
+        Time step implemented
+
+    Returns
+    ----------
+    statesNext : np.ndarray (5) [S E I R D]
+        Next temporal states, as a result of the numerical integration
+
+    """
+    states1 = epidemicModel(N, states, params)
+    states2 = epidemicModel(N, states + 1/2 * step * states1, params)
+    states3 = epidemicModel(N, states + 1/2 * step * states2, params)
+    states4 = epidemicModel(N, states + step * states3, params)
+
+    return states + 1/6 * step * (states1 + 2*states2 + 2*states3 + states4)
+
+
+INTEGRATORS = {'euler': euler,
+               'heun': heun,
+               'rk4': runge_kutta_4,
+               'classic_rk4': classic_runge_kutta_4}
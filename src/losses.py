@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#    Epidemic Models - Calculates parameters of epidemic models
+#    Copyright (C) 2020 Carlos Moreno
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#    See LICENSE
+
+"""
+Losses library
+
+Losses of a batch of simulated [I R D] curves against the observed
+data, vectorised over the batch. All of them average over the days and
+the compartments of each patch, with a weight per compartment, and then
+over the patches. Missing observations, NaN in the data, are left out
+of the averages. Several losses can be evaluated from the same curves.
+
+"""
+
+#######################################################################
+# Imports area
+#######################################################################
+
+# Generic / Built-in
+
+# Other Libs
+import numpy as np
+from scipy.special import gammaln  # pylint: disable=no-name-in-module
+
+
+# Own Libs
+
+
+#######################################################################
+
+# Smallest expected count of the likelihoods
+_MIN_MEAN = 1e-9
+
+
+def rmse(simData: np.ndarray, realData: np.ndarray,
+         weights: np.ndarray) -> np.ndarray:
+    """
+    Root mean squared error of each patch
+
+    Parameters
+    ----------
+    simData : np.ndarray (BxDx3) or (BxDxPx3) [I R D]
+        Simulated daily cases of each member of the batch
+
+    realData : np.ndarray (Dx3) or (DxPx3) [I R D]
+        Observed daily cases
+
+    weights : np.ndarray (Dx3) or (DxPx3) [float]
+        Weight of each observation, the one of its compartment or 0 if
+        it is missing
+
+    Returns
+    ----------
+    loss : np.ndarray (B) [float]
+        Mean over the patches of their RMSE
+
+    """
+    squaredErrors = (simData - realData)**2
+
+    return _patch_mean(np.sqrt(_weighted_mean(squaredErrors, weights)))
+
+
+def normalised_rmse(simData: np.ndarray, realData: np.ndarray,
+                    weights: np.ndarray) -> np.ndarray:
+    """
+    Root mean squared error of each patch, with the errors of each
+    compartment divided by its root mean square in the data, so all of
+    them count the same whatever their size
+
+    Parameters
+    ----------
+    simData : np.ndarray (BxDx3) or (BxDxPx3) [I R D]
+        Simulated daily cases of each member of the batch
+
+    realData : np.ndarray (Dx3) or (DxPx3) [I R D]
+        Observed daily cases
+
+    weights : np.ndarray (Dx3) or (DxPx3) [float]
+        Weight of each observation, the one of its compartment or 0 if
+        it is missing
+
+    Returns
+    ----------
+    loss : np.ndarray (B) [float]
+        Mean over the patches of their normalised RMSE
+
+    """
+    scale = np.sqrt(np.sum(weights * realData**2, axis=0)
+                    / np.maximum(np.sum(weights, axis=0), 1e-300))
+    scale[scale == 0] = 1.0
+
+    return rmse(simData / scale, realData / scale, weights)
+
+
+def log_rmse(simData: np.ndarray, realData: np.ndarray,
+             weights: np.ndarray) -> np.ndarray:
+    """
+    Root mean squared error of each patch in logarithmic scale, log(1+x)
+
+    Parameters
+    ----------
+    simData : np.ndarray (BxDx3) or (BxDxPx3) [I R D]
+        Simulated daily cases of each member of the batch
+
+    realData : np.ndarray (Dx3) or (DxPx3) [I R D]
+        Observed daily cases
+
+    weights : np.ndarray (Dx3) or (DxPx3) [float]
+        Weight of each observation, the one of its compartment or 0 if
+        it is missing
+
+    Returns
+    ----------
+    loss : np.ndarray (B) [float]
+        Mean over the patches of their RMSE of the logarithms
+
+    """
+    return rmse(np.log1p(np.maximum(simData, 0)),
+                np.log1p(np.maximum(realData, 0)), weights)
+
+
+def poisson(simData: np.ndarray, realData: np.ndarray,
+            weights: np.ndarray) -> np.ndarray:
+    """
+    Negative log-likelihood of the data as Poisson counts with the
+    simulated cases as mean, per observation
+
+    Parameters
+    ----------
+    simData : np.ndarray (BxDx3) or (BxDxPx3) [I R D]
+        Simulated daily cases of each member of the batch
+
+    realData : np.ndarray (Dx3) or (DxPx3) [I R D]
+        Observed daily cases
+
+    weights : np.ndarray (Dx3) or (DxPx3) [float]
+        Weight of each observation, the one of its compartment or 0 if
+        it is missing
+
+    Returns
+    ----------
+    loss : np.ndarray (B) [float]
+        Mean negative log-likelihood
+
+    """
+    mean = np.maximum(simData, _MIN_MEAN)
+    logLikelihood = realData * np.log(mean) - mean - gammaln(realData + 1)
+
+    return _patch_mean(_weighted_mean(-logLikelihood, weights))
+
+
+def negative_binomial(simData: np.ndarray, realData: np.ndarray,
+                      weights: np.ndarray, dispersion: float) -> np.ndarray:
+    """
+    Negative log-likelihood of the data as negative binomial counts with
+    the simulated cases as mean, per observation. The variance is
+    mean + mean²/dispersion, so it tends to Poisson as dispersion grows
+
+    Parameters
+    ----------
+    simData : np.ndarray (BxDx3) or (BxDxPx3) [I R D]
+        Simulated daily cases of each member of the batch
+
+    realData : np.ndarray (Dx3) or (DxPx3) [I R D]
+        Observed daily cases
+
+    weights : np.ndarray (Dx3) or (DxPx3) [float]
+        Weight of each observation, the one of its compartment or 0 if
+        it is missing
+
+    dispersion : float
+        Dispersion parameter r
+
+    Returns
+    ----------
+    loss : np.ndarray (B) [float]
+        Mean negative log-likelihood
+
+    """
+    mean = np.maximum(simData, _MIN_MEAN)
+    logLikelihood = gammaln(realData + dispersion) - gammaln(dispersion) \
+        - gammaln(realData + 1) \
+        + dispersion * np.log(dispersion / (dispersion + mean)) \
+        + realData * np.log(mean / (dispersion + mean))
+
+    return _patch_mean(_weighted_mean(-logLikelihood, weights))
+
+
+def evaluate_losses(simData: np.ndarray, realData: np.ndarray, losses: list,
+                    lossOptions=None) -> np.ndarray:
+    """
+    Function that evaluates several losses of the same simulated curves
+
+    Parameters
+    ----------
+    simData : np.ndarray (BxDx3) or (BxDxPx3) [I R D]
+        Simulated daily cases of each member of the batch
+
+    realData : np.ndarray (Dx3) or (DxPx3) [I R D]
+        Observed daily cases, NaN if missing
+
+    losses : list [str]
+        Names of the losses in LOSSES
+
+    lossOptions : dict, optional
+        Weight of each compartment [I R D] (weights), the same for all
+        if missing, and dispersion parameter of the negative binomial
+        likelihood (dispersion), 10 if missing
+
+    Returns
+    ----------
+    losses : np.ndarray (BxL) [float]
+        Evaluation of each loss of each member
+
+    """
+    # The losses are computed in float64, whatever the precision of the
+    # integration
+    simData = np.asarray(simData, dtype=np.float64)
+    realData = np.asarray(realData, dtype=np.float64)
+
+    lossOptions = lossOptions or {}
+    weights = np.asarray(lossOptions.get('weights', np.ones(3)),
+                         dtype=np.float64)
+    weights = weights / np.mean(weights)
+
+    # The missing observations have no weight
+    observed = np.isfinite(realData)
+    weights = np.where(observed, weights, 0.0)
+    realData = np.where(observed, realData, 0.0)
+
+    options = {'negative_binomial': {
+        'dispersion': lossOptions.get('dispersion', 10.0)}}
+
+    return np.stack([LOSSES[loss](simData, realData, weights,
+                                  **options.get(loss, {}))
+                     for loss in losses], axis=-1)
+
+
+def _weighted_mean(values: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Weighted mean over the days and the compartments of each patch
+
+    Parameters
+    ----------
+    values : np.ndarray (BxDx3) or (BxDxPx3) [float]
+        Values of each member, day and compartment
+
+    weights : np.ndarray (Dx3) or (DxPx3) [float]
+        Weight of each observation, the one of its compartment or 0 if
+        it is missing
+
+    Returns
+    ----------
+    mean : np.ndarray (B) or (BxP) [float]
+        Weighted mean of each member and patch
+
+    """
+    return np.sum(values * weights, axis=(1, -1)) \
+        / np.sum(weights, axis=(0, -1))
+
+
+def _patch_mean(values: np.ndarray) -> np.ndarray:
+    """
+    Mean over the patches, if there are several
+
+    Parameters
+    ----------
+    values : np.ndarray (B) or (BxP) [float]
+        Values of each member and patch
+
+    Returns
+    ----------
+    mean : np.ndarray (B) [float]
+        Mean of each member
+
+    """
+    return np.mean(values.reshape(len(values), -1), axis=1)
+
+
+LOSSES = {'rmse': rmse,
+          'normalised_rmse': normalised_rmse,
+          'log_rmse': log_rmse,
+          'poisson': poisson,
+          'negative_binomial': negative_binomial}
@@ -31,18 +31,22 @@ Main library
 #######################################################################
 
 # Generic / Built-in
-
+from functools import partial
 
 # Other Libs
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 import toml
 
 # Own Libs
 from models import EPIDEMIC_MODELS
-from integrators import runge_kutta_4
-from GA.population import Population
+from integrators import INTEGRATORS
+from losses import LOSSES, evaluate_losses
+from evaluator import Evaluator
+from store import HistoryRecorder, ResultsStore
+from GA.optimisers import OPTIMISERS
 
 #######################################################################
 
@@ -60,21 +64,32 @@ def main():
     """
 
     config = toml.load('../config/configuration.toml', _dict=dict)
+    config['population']['fitness_function'] = load_fitness_config(config)
+
+    evaluator = Evaluator(config['population']['fitness_function'],
+                          config['evaluator']['backend'],
+                          config['evaluator']['processes'],
+                          config['evaluator']['chunk_size'],
+                          precision=config['evaluator']['precision'],
+                          distributed=config['distributed'])
+
+    optimiser = OPTIMISERS[config['population'].get('optimiser', 'ga')](
+        config['population'], fitness_function, evaluator=evaluator)
+
+    optimiser.initialise_population()
 
-    realDataDf = pd.read_csv('../data/IRD_Madrid.csv')
-    realData = np.zeros((realDataDf.shape[0], 3))
-    realData[:, 0] = realDataDf[realDataDf.columns[1]]
-    realData[:, 1] = realDataDf[realDataDf.columns[2]]
-    realData[:, 2] = realDataDf[realDataDf.columns[3]]
-    config['population']['fitness_function']['realData'] = realData
+    store, run = create_run(config)
 
-    population = Population(config['population'], fitness_function)
+    optimiser.optimise(HistoryRecorder(store, run))
 
-    population.initialise_population()
+    params, cost = optimiser.validate(
+        config['evaluator']['validation_elite'],
+        config['evaluator']['validation_tolerance'])
 
-    population.optimise()
+    evaluator.close()
 
-    params = population.individuals[0].chromosome
+    record_fit(store, run, config['population']['fitness_function'], params,
+               cost)
 
     return params
 
@@ -93,8 +108,8 @@ def test(params):
 
     """
 
-    config = toml.load('../config/configuration.toml', _dict=dict)[
-        'population']['fitness_function']
+    config = load_fitness_config(
+        toml.load('../config/configuration.toml', _dict=dict))
 
     # Initial states [S E I R D]
     initialStates = config['initialStates']
@@ -106,17 +121,13 @@ def test(params):
     # Period in days
     T = config['period']
 
-    statesAllPeriod, time = get_curves('SEIR', initialStates, params, T, step)
+    statesAllPeriod, time = get_curves(config['epidemicModel'],
+                                       initialStates, params, T, step,
+                                       config.get('mobility'),
+                                       config.get('integrator', 'rk4'))
 
     # Cost function
-    realDataDf = pd.read_csv('../data/IRD_Madrid.csv')
-    realData = np.zeros((realDataDf.shape[0], 3))
-    realData[:, 0] = realDataDf[realDataDf.columns[1]]
-    realData[:, 1] = realDataDf[realDataDf.columns[2]]
-    realData[:, 2] = realDataDf[realDataDf.columns[3]]
-
     config['params'] = params
-    config['realData'] = realData
     cost = fitness_function(**config)
 
     print(cost)
@@ -135,16 +146,19 @@ def test(params):
     ax.set_ylabel('Number of people')
     # ax.xaxis.set_major_locator(ticker.MultipleLocator(24))
 
+    # The patches of a metapopulation are plotted together
+    curves = statesAllPeriod.reshape((len(time), -1, 5)).sum(axis=1)
+
     # Plot the different
-    ax.plot(time, statesAllPeriod[:, 0], color='blue', lw='2',
+    ax.plot(time, curves[:, 0], color='blue', lw='2',
             label='Susceptible cases')
-    ax.plot(time, statesAllPeriod[:, 1], color='yellow', lw='2',
+    ax.plot(time, curves[:, 1], color='yellow', lw='2',
             label='Exposed cases')
-    ax.plot(time, statesAllPeriod[:, 2], color='red', lw='2',
+    ax.plot(time, curves[:, 2], color='red', lw='2',
             label='Infected cases')
-    ax.plot(time, statesAllPeriod[:, 3], color='green', lw='2',
+    ax.plot(time, curves[:, 3], color='green', lw='2',
             label='Recovered cases')
-    ax.plot(time, statesAllPeriod[:, 4], color='black', lw='2',
+    ax.plot(time, curves[:, 4], color='black', lw='2',
             label='Dead cases')
 
     ax.legend()
@@ -152,8 +166,240 @@ def test(params):
     return statesAllPeriod[::int(24/step)]
 
 
+def create_run(config: dict) -> tuple:
+    """
+    Function that creates the run of an optimisation in the results
+    store
+
+    Parameters
+    ----------
+    config : dict
+        Whole configuration of the program
+
+    Returns
+    ----------
+    store : ~store.ResultsStore
+        Store of the results
+
+    run : str
+        Name of the run
+
+    """
+    populationConfig = config['population']
+    fitnessConfig = populationConfig['fitness_function']
+
+    store = ResultsStore(config['store']['path'])
+    run = store.create_run({
+        'optimiser': populationConfig.get('optimiser', 'ga'),
+        'num_generations': populationConfig['num_generations'],
+        'size_population': populationConfig['size_population'],
+        'epidemicModel': fitnessConfig['epidemicModel'],
+        'period': fitnessConfig['period'],
+        'step': fitnessConfig['step']})
+
+    return store, run
+
+
+def record_fit(store, run: str, fitnessConfig: dict, params: np.ndarray,
+               cost: float) -> None:
+    """
+    Function that stores the fitted parameters of a run, their daily
+    trajectory and their losses
+
+    Parameters
+    ----------
+    store : ~store.ResultsStore
+        Store of the results
+
+    run : str
+        Name of the run
+
+    fitnessConfig : dict
+        Configuration with the parameters of the fitness_function
+
+    params : np.ndarray (5) [β ε σ ρ μ]
+        Parameters fitted
+
+    cost : float
+        Cost of the parameters
+
+    Returns
+    ----------
+
+    """
+    step = fitnessConfig['step']
+    statesAllPeriod, _ = get_curves(fitnessConfig['epidemicModel'],
+                                    fitnessConfig['initialStates'], params,
+                                    fitnessConfig['period'], step,
+                                    fitnessConfig.get('mobility'),
+                                    fitnessConfig.get('integrator', 'rk4'))
+
+    dailyStates = statesAllPeriod[::int(24/step)]
+
+    # Every loss of lossOptions, to compare fits of different losses
+    lossOptions = fitnessConfig.get('lossOptions') or {}
+    names = lossOptions.get('losses', list(LOSSES))
+    losses = evaluate_losses(dailyStates[None, ..., 2:],
+                             fitnessConfig['realData'], names, lossOptions)
+
+    store.append(run, 'params', params[None])
+    store.append(run, 'trajectory', dailyStates)
+    store.update_metadata(run, {'cost': float(cost),
+                                'losses': dict(zip(names,
+                                                   losses[0].tolist()))})
+
+
+def load_fitness_config(config: dict) -> dict:
+    """
+    Function that completes the configuration of the fitness function
+    with the observed data of the chosen epidemic model
+
+    Parameters
+    ----------
+    config : dict
+        Whole configuration of the program
+
+    Returns
+    ----------
+    fitnessConfig : dict
+        Configuration with the parameters of the fitness_function
+
+    """
+    fitnessConfig = config['population']['fitness_function']
+
+    if fitnessConfig['epidemicModel'] == 'metaSEIR':
+        realData, initialStates, _ = load_regional_data(
+            '../data', config['regions']['populations'])
+        fitnessConfig['initialStates'] = initialStates
+        fitnessConfig['period'] = realData.shape[0]
+        fitnessConfig['mobility'] = load_mobility(
+            config['regions']['mobility'], initialStates.shape[0])
+    else:
+        realDataDf = pd.read_csv('../data/IRD_Madrid.csv')
+        realData = np.zeros((realDataDf.shape[0], 3))
+        realData[:, 0] = realDataDf[realDataDf.columns[1]]
+        realData[:, 1] = realDataDf[realDataDf.columns[2]]
+        realData[:, 2] = realDataDf[realDataDf.columns[3]]
+    fitnessConfig['realData'] = realData
+
+    return fitnessConfig
+
+
+def load_regional_data(dataDir: str, populations: dict) -> tuple:
+    """
+    Function that loads the I, R and D curves of the autonomous
+    communities over the days of the infected file, with NaN where R or
+    D were not reported yet
+
+    Parameters
+    ----------
+    dataDir : str
+        Directory with the ccaa_covid19_[IRD].csv files
+
+    populations : dict {cod_ine: int}
+        Total population of each region
+
+    Returns
+    ----------
+    realData : np.ndarray (DxPx3) [I R D]
+        Observed daily cases of each region, NaN if missing
+
+    initialStates : np.ndarray (Px5) [S E I R D]
+        Initial states of each region, from the first observed day
+
+    regions : list [str]
+        Names of the regions, in the order of the patches
+
+    """
+    curvesDf = [pd.read_csv(f'{dataDir}/ccaa_covid19_{name}.csv',
+                            dtype={'cod_ine': str}, encoding='utf-8-sig',
+                            index_col='cod_ine').drop('00')
+                for name in 'IRD']
+
+    # The days missing in the R and D files are masked in the losses
+    days = curvesDf[0].columns[1:]
+
+    codes = curvesDf[0].index
+    realData = np.stack([curveDf.reindex(columns=days).loc[codes]
+                         .to_numpy(dtype=float).T
+                         for curveDf in curvesDf], axis=-1)
+
+    # Compartments not reported yet start empty
+    initialStates = np.zeros((len(codes), 5))
+    initialStates[:, 2:] = np.nan_to_num(realData[0])
+    initialStates[:, 0] = [populations[code] for code in codes]
+    initialStates[:, 0] -= initialStates[:, 2:].sum(axis=1)
+
+    return realData, initialStates, list(curvesDf[0].loc[codes, 'CCAA'])
+
+
+def load_mobility(path: str, numPatches: int) -> sp.csr_matrix:
+    """
+    Function that loads the mobility matrix of a metapopulation model
+
+    Parameters
+    ----------
+    path : str
+        File saved with scipy.sparse.save_npz, where the element (i, j)
+        are the contacts of patch i with patch j. With an empty path the
+        patches are uncoupled
+
+    numPatches : int
+        Number of patches of the model
+
+    Returns
+    ----------
+    mobility : scipy.sparse.csr_matrix (PxP)
+        Row-normalised mobility matrix, where the patches without
+        contacts only mix with themselves
+
+    """
+    if not path:
+        return sp.identity(numPatches, format='csr')
+
+    mobility = sp.load_npz(path).tocsr().astype(float)
+    if mobility.shape != (numPatches, numPatches):
+        raise ValueError(f'Mobility matrix of shape {mobility.shape} for '
+                         f'{numPatches} patches')
+
+    # A patch without contacts would feel no force of infection at all
+    rowSums = np.asarray(mobility.sum(axis=1)).ravel()
+    mobility = mobility + sp.diags((rowSums == 0).astype(float))
+    rowSums[rowSums == 0] = 1
+
+    # Each row holds the fractions of the contacts of a patch
+    return sp.diags(1 / rowSums).dot(mobility).tocsr()
+
+
+def hash_mobility(digest, mobility) -> None:
+    """
+    Function that adds a mobility matrix to a hash, from the arrays of
+    its sparse storage instead of the dense matrix
+
+    Parameters
+    ----------
+    digest : hashlib hash
+        Hash updated in place
+
+    mobility : scipy.sparse.csr_matrix (PxP)
+        Mobility matrix, nothing is added if None
+
+    Returns
+    ----------
+
+    """
+    if mobility is None:
+        return
+
+    mobility = sp.csr_matrix(mobility)
+    digest.update(repr(mobility.shape).encode())
+    for values in (mobility.data, mobility.indices, mobility.indptr):
+        digest.update(np.ascontiguousarray(values).tobytes())
+
+
 def get_curves(epidemicModel: str, initialStates: list, params: list,
-               period: float, step: float) -> np.ndarray:
+               period: float, step: float, mobility=None,
+               integrator='rk4') -> np.ndarray:
     """
     Function that obtain the integrated curves of states
 
@@ -162,8 +408,8 @@ def get_curves(epidemicModel: str, initialStates: list, params: list,
     epidemicModel : function
         Epidemic model
 
-    initialStates : np.ndarray (5) [S E I R D]
-        Initial states of the population
+    initialStates : np.ndarray (5) or (Px5) [S E I R D]
+        Initial states of the population, or of each of the P patches
 
     params : np.ndarray (5) [β ε σ ρ μ]
         Parameters of the model. See README
@@ -174,9 +420,15 @@ def get_curves(epidemicModel: str, initialStates: list, params: list,
     step : float [h]
         Time steps of the integration
 
+    mobility : scipy.sparse.csr_matrix (PxP), optional
+        Mobility matrix coupling the patches of a metapopulation model
+
+    integrator : str
+        Name of the integrator in INTEGRATORS
+
     Returns
     ----------
-    statesAllPeriod : np.ndarray (Nx5) [S E I R D]
+    statesAllPeriod : np.ndarray (Nx5) or (NxPx5) [S E I R D]
         Integration over the whole period
 
     time : np.ndarray (N) [d]
@@ -185,28 +437,35 @@ def get_curves(epidemicModel: str, initialStates: list, params: list,
     """
     # Epidemic model chosen
     model = EPIDEMIC_MODELS[epidemicModel]
+    if mobility is not None:
+        model = partial(model, mobility=mobility)
 
-    N = np.sum(initialStates)
+    # Integrator chosen
+    integrate = INTEGRATORS[integrator]
+
+    initialStates = np.asarray(initialStates, dtype=float)
+    N = np.sum(initialStates, axis=-1)
     n = int(period * 24 / step)
     time = np.linspace(0, period*24, n+1)[:-1]/24
 
-    statesAllPeriod = np.zeros((n, 5))
+    statesAllPeriod = np.zeros((n,) + initialStates.shape)
 
-    statesAllPeriod[0, :] = initialStates
+    statesAllPeriod[0] = initialStates
 
     for i in range(n-1):
-        statesAllPeriod[i+1, :] = runge_kutta_4(model,
-                                                N,
-                                                statesAllPeriod[i, :],
-                                                params,
-                                                step)
+        statesAllPeriod[i+1] = integrate(model,
+                                         N,
+                                         statesAllPeriod[i],
+                                         params,
+                                         step)
 
     return statesAllPeriod, time
 
 
 def fitness_function(epidemicModel: str, initialStates: list, params: list,
-                     period: float, step: float, realData: np.ndarray
-                     ) -> float:
+                     period: float, step: float, realData: np.ndarray,
+                     mobility=None, integrator='rk4',
+                     lossOptions=None) -> float:
     """
     Function that obtain the integrated curves of states
 
@@ -227,16 +486,33 @@ def fitness_function(epidemicModel: str, initialStates: list, params: list,
     step : float [h]
         Time steps of the integration
 
+    realData : np.ndarray (Dx3) or (DxPx3) [I R D]
+        Observed daily cases, of the population or of each patch
+
+    mobility : scipy.sparse.csr_matrix (PxP), optional
+        Mobility matrix coupling the patches of a metapopulation model
+
+    integrator : str
+        Name of the integrator in INTEGRATORS
+
+    lossOptions : dict, optional
+        Loss of the fitness function (loss), 'rmse' if missing, and its
+        options, see evaluate_losses
+
     Returns
     ----------
     cost : float
-        Evaluation of the cost function
+        Evaluation of the loss, averaged over the patches
 
     """
-    simData, _ = get_curves(epidemicModel, initialStates, params, period, step)
-    simDataIRD = simData[::int(24/step), 2:]
-
-    cost = np.sqrt(np.mean((simDataIRD - realData)**2))
+    simData, _ = get_curves(epidemicModel, initialStates, params, period, step,
+                            mobility, integrator)
+    simDataIRD = simData[::int(24/step), ..., 2:]
+
+    lossOptions = lossOptions or {}
+    cost = evaluate_losses(simDataIRD[None], realData,
+                           [lossOptions.get('loss', 'rmse')],
+                           lossOptions)[0, 0]
 
     return cost
 
@@ -44,36 +44,89 @@ def seir_model(N: int, states: np.ndarray, params: np.ndarray) -> np.ndarray:
     """
     SEIR epidemic scheme
 
+    The states and parameters may have leading dimensions to integrate
+    a batch of B populations at once.
+
     Parameters
     ----------
-    N : int
+    N : int or np.ndarray (B)
         Total population
 
-    states : np.ndarray (5) [S E I R D]
+    states : np.ndarray (5) or (Bx5) [S E I R D]
         Different states of the population. See README
 
-    params : np.ndarray (5) [β ε σ ρ μ]
+    params : np.ndarray (5) or (Bx5) [β ε σ ρ μ]
         Parameters of the model. See README
 
     Returns
     ----------
-    changeStates : np.ndarray (5) [S E I R D]
+    changeStates : np.ndarray (5) or (Bx5) [S E I R D]
         New states
 
     """
 
     # To clarify the equations (there are other ways to do it faster)
-    S, E, I, _, _ = states
-    β, ε, σ, ρ, μ = params
+    S, E, I, _, _ = np.moveaxis(states, -1, 0)
+    β, ε, σ, ρ, μ = np.moveaxis(params, -1, 0)
 
-    changeStates = np.array([- (β*I + ε*E) * S/N,
+    changeStates = np.stack([- (β*I + ε*E) * S/N,
                              (β*I + ε*E) * S/N - σ*E,
                              σ*E - ρ*I - μ*I,
                              ρ*I,
                              μ*I
-                             ])
+                             ], axis=-1)
+
+    return changeStates
+
+
+def metapopulation_seir_model(N: np.ndarray, states: np.ndarray,
+                              params: np.ndarray, mobility) -> np.ndarray:
+    """
+    SEIR epidemic scheme over several patches coupled by mobility
+
+    Each patch has its own SEIR block, and the force of infection of a
+    patch mixes the infectious pressure of every patch through the
+    mobility matrix, so the whole right hand side is a sparse
+    matrix-vector product. The states and parameters may have a leading
+    dimension to integrate a batch of B metapopulations at once.
+
+    Parameters
+    ----------
+    N : np.ndarray (P) [int]
+        Total population of each patch
+
+    states : np.ndarray (Px5) or (BxPx5) [S E I R D]
+        Different states of the population of each patch. See README
+
+    params : np.ndarray (5) or (Bx5) [β ε σ ρ μ]
+        Parameters of the model, shared by all patches. See README
+
+    mobility : scipy.sparse.csr_matrix (PxP)
+        Row-normalised contact matrix, where the element (i, j) is the
+        fraction of the contacts of patch i made with patch j
+
+    Returns
+    ----------
+    changeStates : np.ndarray (Px5) or (BxPx5) [S E I R D]
+        New states
+
+    """
+
+    S, E, I, _, _ = np.moveaxis(states, -1, 0)
+    β, ε, σ, ρ, μ = np.moveaxis(params, -1, 0)[..., None]
+
+    # Force of infection felt in each patch
+    forceInfection = mobility.dot(((β*I + ε*E) / N).T).T
+
+    changeStates = np.empty_like(states)
+    changeStates[..., 0] = - forceInfection * S
+    changeStates[..., 1] = forceInfection * S - σ*E
+    changeStates[..., 2] = σ*E - ρ*I - μ*I
+    changeStates[..., 3] = ρ*I
+    changeStates[..., 4] = μ*I
 
     return changeStates
 
 
-EPIDEMIC_MODELS = {'SEIR': seir_model}
+EPIDEMIC_MODELS = {'SEIR': seir_model,
+                   'metaSEIR': metapopulation_seir_model}
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#    Epidemic Models - Calculates parameters of epidemic models
+#    Copyright (C) 2020 Carlos Moreno
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#    See LICENSE
+
+"""
+Incremental daily recalibration
+
+Each run compares the observed data with the dataset cached by the
+previous run. The new days are first checked against the checkpoint of
+the previous fit, integrating only those days from the state stored at
+the last fitted day. If the parameters still fit, only the checkpoint
+is extended; otherwise a short optimisation is warm started from the
+elite of the previous fitness archive.
+
+"""
+
+#######################################################################
+# Imports area
+#######################################################################
+
+# Generic / Built-in
+from functools import partial
+import hashlib
+import os
+
+# Other Libs
+import numpy as np
+import toml
+
+# Own Libs
+from evaluator import Evaluator
+from integrators import INTEGRATORS
+from losses import evaluate_losses
+from main import fitness_function, hash_mobility, load_fitness_config
+from models import EPIDEMIC_MODELS
+from GA.optimisers import OPTIMISERS
+
+#######################################################################
+
+
+def main():
+    """
+    Main program to recalibrate the parameters with the new days
+
+    Parameters
+    ----------
+
+    Returns
+    ----------
+    params : np.ndarray (5) [β ε σ ρ μ]
+        Parameters fitted to the whole history
+
+    """
+    config = toml.load('../config/configuration.toml', _dict=dict)
+    onlineConfig = config['online']
+
+    fitnessConfig = load_fitness_config(config)
+    realData = fitnessConfig['realData']
+    fitnessConfig['period'] = realData.shape[0]
+
+    cachePath = os.path.join(onlineConfig['cache_dir'],
+                             f"online_{fitnessConfig['epidemicModel']}.npz")
+    cache = load_cache(cachePath, realData, config_key(fitnessConfig))
+
+    seeds = None
+    if cache is not None:
+        oldDays = cache['realData'].shape[0]
+        if oldDays == realData.shape[0]:
+            print('No new days')
+            return cache['params']
+
+        checkpoint = extend_checkpoint(cache, fitnessConfig)
+
+        # The parameters are kept while they fit the extended history
+        # nearly as well as they fitted the previous one
+        if checkpoint['cost'] \
+                <= (1 + onlineConfig['tolerance']) * cache['cost']:
+            save_cache(cachePath, fitnessConfig, cache['params'], checkpoint,
+                       (cache['archiveChromosomes'], cache['archiveScores']))
+            print(f'Parameters kept, cost {checkpoint["cost"]}')
+            return cache['params']
+
+        seeds = cache['archiveChromosomes']
+        config['population']['num_generations'] = \
+            onlineConfig['num_generations']
+
+    config['population']['fitness_function'] = fitnessConfig
+    evaluatorConfig = config['evaluator']
+    evaluator = Evaluator(fitnessConfig, evaluatorConfig['backend'],
+                          evaluatorConfig['processes'],
+                          evaluatorConfig['chunk_size'],
+                          precision=evaluatorConfig['precision'],
+                          distributed=config['distributed'])
+
+    optimiser = OPTIMISERS[config['population'].get('optimiser', 'ga')](
+        config['population'], fitness_function, evaluator=evaluator)
+    optimiser.initialise_population(seeds)
+    optimiser.optimise()
+
+    params, _ = optimiser.validate(evaluatorConfig['validation_elite'],
+                                   evaluatorConfig['validation_tolerance'])
+    evaluator.close()
+
+    checkpoint = fit_checkpoint(fitnessConfig, params)
+    save_cache(cachePath, fitnessConfig, params, checkpoint,
+               optimiser.elite(onlineConfig['archive_size']))
+    print(f'Parameters refitted, cost {checkpoint["cost"]}')
+
+    return params
+
+
+def integrate_days(epidemicModel: str, states: np.ndarray, params: np.ndarray,
+                   numDays: int, step: float, mobility=None,
+                   integrator='rk4') -> tuple:
+    """
+    Function that integrates whole days from a given state
+
+    Parameters
+    ----------
+    epidemicModel : function
+        Epidemic model
+
+    states : np.ndarray (5) or (Px5) [S E I R D]
+        States at the beginning of the first day
+
+    params : np.ndarray (5) [β ε σ ρ μ]
+        Parameters of the model. See README
+
+    numDays : int
+        Number of days to integrate
+
+    step : float [h]
+        Time steps of the integration
+
+    mobility : scipy.sparse.csr_matrix (PxP), optional
+        Mobility matrix coupling the patches of a metapopulation model
+
+    integrator : str
+        Name of the integrator in INTEGRATORS
+
+    Returns
+    ----------
+    dailyStates : np.ndarray (Dx5) or (DxPx5) [S E I R D]
+        States at the beginning of each day, as get_curves(...)[::24/step]
+
+    nextStates : np.ndarray (5) or (Px5) [S E I R D]
+        States at the beginning of the day after the last one
+
+    """
+    model = EPIDEMIC_MODELS[epidemicModel]
+    if mobility is not None:
+        model = partial(model, mobility=mobility)
+    integrate = INTEGRATORS[integrator]
+
+    states = np.asarray(states, dtype=float)
+    N = np.sum(states, axis=-1)
+    stepsDay = int(24 / step)
+
+    dailyStates = np.zeros((numDays,) + states.shape)
+    for day in range(numDays):
+        dailyStates[day] = states
+
+        for _ in range(stepsDay):
+            states = integrate(model, N, states, params, step)
+
+    return dailyStates, states
+
+
+def fit_checkpoint(fitnessConfig: dict, params: np.ndarray) -> dict:
+    """
+    Function that integrates the whole history with a set of parameters
+    and keeps the state at the last day and the squared errors
+
+    Parameters
+    ----------
+    fitnessConfig : dict
+        Configuration with the parameters of the fitness_function
+
+    params : np.ndarray (5) [β ε σ ρ μ]
+        Parameters of the model. See README
+
+    Returns
+    ----------
+    checkpoint : dict
+        States after the last fitted day, simulated [I R D] of each day
+        and cost of the parameters
+
+    """
+    realData = fitnessConfig['realData']
+    dailyStates, states = integrate_days(fitnessConfig['epidemicModel'],
+                                         fitnessConfig['initialStates'],
+                                         params, realData.shape[0],
+                                         fitnessConfig['step'],
+                                         fitnessConfig.get('mobility'),
+                                         fitnessConfig.get('integrator',
+                                                           'rk4'))
+
+    curves = dailyStates[..., 2:]
+
+    return {'states': states, 'curves': curves,
+            'cost': _cost(curves, fitnessConfig)}
+
+
+def extend_checkpoint(cache: dict, fitnessConfig: dict) -> dict:
+    """
+    Function that extends the checkpoint of the cached parameters over
+    the new days, integrating only those days
+
+    Parameters
+    ----------
+    cache : dict
+        Results of the previous run, see save_cache
+
+    fitnessConfig : dict
+        Configuration with the parameters of the fitness_function
+
+    Returns
+    ----------
+    checkpoint : dict
+        States after the last day, simulated [I R D] of each day and cost
+        of the cached parameters over the whole history
+
+    """
+    realData = fitnessConfig['realData']
+    oldDays = cache['realData'].shape[0]
+
+    dailyStates, states = integrate_days(fitnessConfig['epidemicModel'],
+                                         cache['states'], cache['params'],
+                                         realData.shape[0] - oldDays,
+                                         fitnessConfig['step'],
+                                         fitnessConfig.get('mobility'),
+                                         fitnessConfig.get('integrator',
+                                                           'rk4'))
+
+    curves = np.concatenate([cache['curves'], dailyStates[..., 2:]])
+
+    return {'states': states, 'curves': curves,
+            'cost': _cost(curves, fitnessConfig)}
+
+
+def config_key(fitnessConfig: dict) -> str:
+    """
+    Function that hashes the settings of the fitness_function that a
+    cached fit depends on, besides the observed data
+
+    Parameters
+    ----------
+    fitnessConfig : dict
+        Configuration with the parameters of the fitness_function
+
+    Returns
+    ----------
+    key : str
+        Hexadecimal digest of the settings
+
+    """
+    digest = hashlib.sha256(repr((
+        fitnessConfig['epidemicModel'], float(fitnessConfig['step']),
+        fitnessConfig.get('integrator', 'rk4'),
+        sorted((fitnessConfig.get('lossOptions') or {}).items()))).encode())
+
+    initialStates = np.asarray(fitnessConfig['initialStates'], dtype=float)
+    digest.update(repr(initialStates.shape).encode())
+    digest.update(initialStates.tobytes())
+
+    hash_mobility(digest, fitnessConfig.get('mobility'))
+
+    return digest.hexdigest()
+
+
+def load_cache(path: str, realData: np.ndarray, key: str):
+    """
+    Function that loads the results of the previous run, if it used the
+    same settings and its dataset is the beginning of the current one
+
+    Parameters
+    ----------
+    path : str
+        File of the cache
+
+    realData : np.ndarray (Dx3) or (DxPx3) [I R D]
+        Observed daily cases
+
+    key : str
+        Hash of the settings of the fitness_function, see config_key
+
+    Returns
+    ----------
+    cache : dict
+        Results of the previous run, None if there is no valid cache
+
+    """
+    if not os.path.exists(path):
+        return None
+
+    with np.load(path) as cacheFile:
+        cache = dict(cacheFile)
+
+    if str(cache.get('key')) != key:
+        return None
+
+    # Revised past data invalidate the checkpoint, with missing days
+    # equal to each other
+    oldData = cache['realData']
+    if oldData.shape[0] > realData.shape[0] \
+            or oldData.shape[1:] != realData.shape[1:]:
+        return None
+
+    newData = realData[:oldData.shape[0]]
+    if not np.array_equal(np.isnan(oldData), np.isnan(newData)) \
+            or not np.array_equal(np.nan_to_num(oldData),
+                                  np.nan_to_num(newData)):
+        return None
+
+    return cache
+
+
+def save_cache(path: str, fitnessConfig: dict, params: np.ndarray,
+               checkpoint: dict, archive: tuple) -> None:
+    """
+    Function that saves the results of a run for the next one
+
+    Parameters
+    ----------
+    path : str
+        File of the cache
+
+    fitnessConfig : dict
+        Configuration with the parameters of the fitness_function, with
+        the observed daily cases fitted
+
+    params : np.ndarray (5) [β ε σ ρ μ]
+        Parameters fitted
+
+    checkpoint : dict
+        States after the last day, simulated [I R D] of each day and cost
+
+    archive : tuple (np.ndarray (MxN), np.ndarray (M))
+        Elite of the fitness archive, from best to worst
+
+    Returns
+    ----------
+
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    np.savez(path, key=config_key(fitnessConfig),
+             realData=fitnessConfig['realData'], params=params,
+             states=checkpoint['states'], curves=checkpoint['curves'],
+             cost=checkpoint['cost'], archiveChromosomes=archive[0],
+             archiveScores=archive[1])
+
+
+def _cost(curves: np.ndarray, fitnessConfig: dict) -> float:
+    """
+    Cost of the fitness_function from the simulated curves
+
+    Parameters
+    ----------
+    curves : np.ndarray (Dx3) or (DxPx3) [I R D]
+        Simulated daily cases
+
+    fitnessConfig : dict
+        Configuration with the parameters of the fitness_function
+
+    Returns
+    ----------
+    cost : float
+        Evaluation of the loss of the fitness_function
+
+    """
+    lossOptions = fitnessConfig.get('lossOptions') or {}
+
+    return float(evaluate_losses(curves[None], fitnessConfig['realData'],
+                                 [lossOptions.get('loss', 'rmse')],
+                                 lossOptions)[0, 0])
+
+
+if __name__ == "__main__":
+    PARAMS = main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#    Epidemic Models - Calculates parameters of epidemic models
+#    Copyright (C) 2020 Carlos Moreno
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#    See LICENSE
+
+"""
+Global sensitivity analysis
+
+Sobol indices of the fitness function, or of a compartment of the model
+at the last day, with respect to the parameters [β ε σ ρ μ], estimated
+with the Saltelli sampling scheme over the bounds of the population.
+
+"""
+
+#######################################################################
+# Imports area
+#######################################################################
+
+# Generic / Built-in
+from functools import partial
+
+# Other Libs
+import numpy as np
+import toml
+from scipy.stats import qmc
+
+# Own Libs
+from evaluator import Evaluator, batch_fitness, get_curves_batch
+from main import load_fitness_config
+
+#######################################################################
+
+PARAMS_NAMES = ['β', 'ε', 'σ', 'ρ', 'μ']
+COMPARTMENTS = {'S': 0, 'E': 1, 'I': 2, 'R': 3, 'D': 4}
+
+
+def main():
+    """
+    Main program to compute the Sobol indices of the parameters
+
+    Parameters
+    ----------
+
+    Returns
+    ----------
+    firstOrder : np.ndarray (5) [float]
+        First order index of each parameter
+
+    totalOrder : np.ndarray (5) [float]
+        Total order index of each parameter
+
+    """
+    config = toml.load('../config/configuration.toml', _dict=dict)
+    fitnessConfig = load_fitness_config(config)
+    populationConfig = config['population']
+    sensitivityConfig = config['sensitivity']
+
+    numParams = populationConfig['num_genes']
+    numSamples = sensitivityConfig['samples']
+    samples = saltelli_sample(numSamples, numParams,
+                              populationConfig['min_values'],
+                              populationConfig['max_values'])
+
+    if sensitivityConfig['output'] == 'fitness':
+        function = batch_fitness
+    else:
+        function = partial(last_day_compartment,
+                           COMPARTMENTS[sensitivityConfig['output']])
+
+    with Evaluator(fitnessConfig, config['evaluator']['backend'],
+                   config['evaluator']['processes'],
+                   config['evaluator']['chunk_size'], function,
+                   config['evaluator']['precision'],
+                   config['distributed']) as evaluator:
+        outputs = evaluator(samples)
+
+    firstOrder, totalOrder = sobol_indices(outputs, numSamples, numParams)
+
+    print(f"Sobol indices of {sensitivityConfig['output']} "
+          f"({len(samples)} evaluations)")
+    print('Parameter  First order  Total order')
+    for name, first, total in zip(PARAMS_NAMES, firstOrder, totalOrder):
+        print(f'{name:>9}  {first:11.4f}  {total:11.4f}')
+
+    return firstOrder, totalOrder
+
+
+def saltelli_sample(numSamples: int, numParams: int, minValues,
+                    maxValues) -> np.ndarray:
+    """
+    Function that builds the Saltelli samples from a Sobol sequence
+
+    Parameters
+    ----------
+    numSamples : int
+        Number of base samples N, better a power of 2
+
+    numParams : int
+        Number of parameters d
+
+    minValues : float or list [float]
+        Lower bound of the parameters
+
+    maxValues : float or list [float]
+        Upper bound of the parameters
+
+    Returns
+    ----------
+    samples : np.ndarray (N(d+2) x d) [float]
+        Matrices A, B and the d matrices AB_i, which are A with the
+        column i taken from B, stacked in this order
+
+    """
+    sobol = qmc.Sobol(2 * numParams, seed=np.random.randint(2**31))
+    exponent = int(np.ceil(np.log2(numSamples)))
+    base = sobol.random_base2(exponent)[:numSamples]
+
+    minValues = np.asarray(minValues, dtype=float)
+    maxValues = np.asarray(maxValues, dtype=float)
+    matrixA = base[:, :numParams] * (maxValues - minValues) + minValues
+    matrixB = base[:, numParams:] * (maxValues - minValues) + minValues
+
+    matricesAB = np.repeat(matrixA[None], numParams, axis=0)
+    for i in range(numParams):
+        matricesAB[i, :, i] = matrixB[:, i]
+
+    return np.vstack([matrixA, matrixB] + list(matricesAB))
+
+
+def sobol_indices(outputs: np.ndarray, numSamples: int,
+                  numParams: int) -> tuple:
+    """
+    Function that estimates the first (Saltelli, 2010) and total
+    (Jansen, 1999) order Sobol indices
+
+    Parameters
+    ----------
+    outputs : np.ndarray (N(d+2)) [float]
+        Outputs of the samples of saltelli_sample
+
+    numSamples : int
+        Number of base samples N
+
+    numParams : int
+        Number of parameters d
+
+    Returns
+    ----------
+    firstOrder : np.ndarray (d) [float]
+        First order index of each parameter
+
+    totalOrder : np.ndarray (d) [float]
+        Total order index of each parameter
+
+    """
+    outputsA = outputs[:numSamples]
+    outputsB = outputs[numSamples:2*numSamples]
+    outputsAB = outputs[2*numSamples:].reshape(numParams, numSamples)
+
+    variance = np.var(outputs[:2*numSamples])
+
+    firstOrder = np.mean(outputsB * (outputsAB - outputsA), axis=1) \
+        / variance
+    totalOrder = 0.5 * np.mean((outputsA - outputsAB)**2, axis=1) / variance
+
+    return firstOrder, totalOrder
+
+
+def last_day_compartment(compartment: int, epidemicModel: str,
+                         initialStates: list, params: np.ndarray,
+                         period: float, step: float, mobility=None,
+                         dtype=np.float64, integrator='rk4',
+                         **_) -> np.ndarray:
+    """
+    Function that obtains a compartment at the last day of a batch of
+    integrations, summed over the patches
+
+    Parameters
+    ----------
+    compartment : int
+        Index of the compartment in [S E I R D]
+
+    epidemicModel : function
+        Epidemic model
+
+    initialStates : np.ndarray (5) or (Px5) [S E I R D]
+        Initial states of the population, or of each of the P patches
+
+    params : np.ndarray (Bx5) [β ε σ ρ μ]
+        Parameters of each integration. See README
+
+    period : float [day]
+        Duration of the integration
+
+    step : float [h]
+        Time steps of the integration
+
+    mobility : scipy.sparse.csr_matrix (PxP), optional
+        Mobility matrix coupling the patches of a metapopulation model
+
+    dtype : np.dtype
+        Floating point type of the integration
+
+    integrator : str
+        Name of the integrator in INTEGRATORS
+
+    **_
+        Other parameters of the fitness_function, unused
+
+    Returns
+    ----------
+    lastDay : np.ndarray (B) [float]
+        Compartment at the last day of each integration
+
+    """
+    dailyStates = get_curves_batch(epidemicModel, initialStates, params,
+                                   period, step, mobility, dtype,
+                                   integrator)
+    lastDay = dailyStates[:, -1, ..., compartment]
+
+    return lastDay.reshape(len(lastDay), -1).sum(axis=1, dtype=np.float64)
+
+
+if __name__ == "__main__":
+    FIRST_ORDER, TOTAL_ORDER = main()
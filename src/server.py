@@ -0,0 +1,598 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#    Epidemic Models - Calculates parameters of epidemic models
+#    Copyright (C) 2020 Carlos Moreno
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#    See LICENSE
+
+
+"""
+Calibration job server
+
+Long-lived local service that accepts fit, simulate and scenario jobs,
+queues them by priority and runs them in a pool of processes that keep
+the configuration and the data loaded between jobs.
+
+The protocol is one JSON object per line, over TCP or a Unix socket:
+
+    {"job": "fit", "priority": 1, "config": {"population": {...}}}
+    {"job": "simulate", "params": [0.05, 0.01, 0.02, 0.01, 0.001]}
+    {"job": "scenario", "params": [[...], [...]], "period": 60}
+
+and every job is answered with JSON lines of its events: queued,
+started, progress (only fit jobs), and result or error. Requests longer
+than max_request_bytes are answered with an error and end the
+connection, which is otherwise closed after the client stops sending
+and its jobs finish. The overrides of
+a job cannot change the epidemic model or the regions, since the data
+they need are loaded when the workers start.
+
+"""
+
+#######################################################################
+# Imports area
+#######################################################################
+
+# Generic / Built-in
+import asyncio
+import copy
+import itertools
+import json
+import multiprocessing
+import socket
+from concurrent.futures import ProcessPoolExecutor
+
+# Other Libs
+import numpy as np
+import toml
+
+# Own Libs
+from main import (create_run, fitness_function, get_curves,
+                  load_fitness_config, record_fit)
+from evaluator import Evaluator
+from store import HistoryRecorder
+from GA.optimisers import OPTIMISERS
+
+#######################################################################
+
+# Resident state of each worker process, filled by warm_up
+_WORKER = {}
+
+
+def warm_up(configPath: str, progressQueue) -> None:
+    """
+    Initialiser of the worker processes, which loads the configuration
+    and the data once and for all the jobs of the worker
+
+    Parameters
+    ----------
+    configPath : str
+        Path of the TOML configuration
+
+    progressQueue : multiprocessing.Queue
+        Queue where the progress of the jobs is reported
+
+    Returns
+    ----------
+
+    """
+    config = toml.load(configPath, _dict=dict)
+    config['population']['fitness_function'] = load_fitness_config(config)
+
+    _WORKER['config'] = config
+    _WORKER['progress'] = progressQueue
+
+    # A first integration leaves the numerical libraries loaded
+    fitnessConfig = config['population']['fitness_function']
+    get_curves(fitnessConfig['epidemicModel'], fitnessConfig['initialStates'],
+               np.zeros(5), 1, fitnessConfig['step'],
+               fitnessConfig.get('mobility'),
+               fitnessConfig.get('integrator', 'rk4'))
+
+
+def run_job(jobId: int, job: dict) -> dict:
+    """
+    Runs a job in a warm worker process
+
+    Parameters
+    ----------
+    jobId : int
+        Identifier of the job, to report its progress
+
+    job : dict
+        Request of the job, see the module documentation
+
+    Returns
+    ----------
+    result : dict
+        JSON serialisable result of the job
+
+    """
+    config = copy.deepcopy(_WORKER['config'])
+    _merge_config(config, job.get('config', {}))
+
+    # The observed data and the mobility of the workers only fit the
+    # model and the regions they were loaded for
+    loadedConfig = _WORKER['config']
+    if config['population']['fitness_function']['epidemicModel'] \
+            != loadedConfig['population']['fitness_function'][
+                'epidemicModel'] \
+            or config['regions'] != loadedConfig['regions']:
+        raise ValueError('Jobs cannot change the epidemic model or the '
+                         'regions of the server')
+
+    return JOBS[job['job']](jobId, config, job)
+
+
+def _fit_job(jobId: int, config: dict, job: dict) -> dict:
+    """
+    Fits the parameters of the model to the data
+
+    Parameters
+    ----------
+    jobId : int
+        Identifier of the job, to report its progress
+
+    config : dict
+        Configuration of the job
+
+    job : dict
+        Request of the job
+
+    Returns
+    ----------
+    result : dict
+        Best parameters found, their cost and the run of the results
+        store where the fit is recorded
+
+    """
+    # pylint: disable=unused-argument
+    progressQueue = _WORKER['progress']
+
+    store, run = create_run(config)
+    recorder = HistoryRecorder(store, run)
+
+    # The best score of the archive, since with a surrogate the scores
+    # of the generation are partly predictions
+    def report(generation, optimiser):
+        recorder(generation, optimiser)
+        progressQueue.put((jobId, {'event': 'progress',
+                                   'generation': generation,
+                                   'cost': float(optimiser.best()[1])}))
+
+    # The job already runs in a worker process, so it is not split again
+    evaluatorConfig = config['evaluator']
+    evaluator = Evaluator(config['population']['fitness_function'], 'batch',
+                          chunkSize=evaluatorConfig['chunk_size'],
+                          precision=evaluatorConfig['precision'])
+
+    optimiser = OPTIMISERS[config['population'].get('optimiser', 'ga')](
+        config['population'], fitness_function, evaluator=evaluator)
+    optimiser.initialise_population()
+    optimiser.optimise(report)
+
+    params, cost = optimiser.validate(evaluatorConfig['validation_elite'],
+                                      evaluatorConfig['validation_tolerance'])
+    record_fit(store, run, config['population']['fitness_function'], params,
+               cost)
+
+    return {'params': params.tolist(), 'cost': float(cost), 'run': run}
+
+
+def _simulate_job(jobId: int, config: dict, job: dict) -> dict:
+    """
+    Integrates the model with a set of parameters
+
+    Parameters
+    ----------
+    jobId : int
+        Identifier of the job
+
+    config : dict
+        Configuration of the job
+
+    job : dict
+        Request of the job, with the parameters and optionally the
+        period of the integration
+
+    Returns
+    ----------
+    result : dict
+        Daily states of the integration
+
+    """
+    # pylint: disable=unused-argument
+    fitnessConfig = config['population']['fitness_function']
+    step = fitnessConfig['step']
+
+    states, time = get_curves(fitnessConfig['epidemicModel'],
+                              fitnessConfig['initialStates'],
+                              np.asarray(job['params'], dtype=float),
+                              job.get('period', fitnessConfig['period']),
+                              step, fitnessConfig.get('mobility'),
+                              fitnessConfig.get('integrator', 'rk4'))
+
+    return {'time': time[::int(24/step)].tolist(),
+            'states': states[::int(24/step)].tolist()}
+
+
+def _scenario_job(jobId: int, config: dict, job: dict) -> dict:
+    """
+    Integrates the model with several sets of parameters
+
+    Parameters
+    ----------
+    jobId : int
+        Identifier of the job
+
+    config : dict
+        Configuration of the job
+
+    job : dict
+        Request of the job, with a list of parameters and optionally
+        the period of the integrations
+
+    Returns
+    ----------
+    result : dict
+        Daily states of the integration of each scenario
+
+    """
+    scenarios = [_simulate_job(jobId, config, dict(job, params=params))
+                 for params in job['params']]
+
+    return {'time': scenarios[0]['time'],
+            'states': [scenario['states'] for scenario in scenarios]}
+
+
+def parse_job(line: bytes) -> dict:
+    """
+    Decodes and validates a request
+
+    Parameters
+    ----------
+    line : bytes
+        JSON line of the request
+
+    Returns
+    ----------
+    job : dict
+        Request of the job, see the module documentation
+
+    """
+    job = json.loads(line)
+
+    if not isinstance(job, dict):
+        raise ValueError('Jobs must be JSON objects')
+    if job.get('job') not in JOBS:
+        raise ValueError(f"Unknown job {job.get('job')}")
+    if isinstance(job.get('priority', 0), bool) \
+            or not isinstance(job.get('priority', 0), (int, float)):
+        raise ValueError('Priorities must be numbers')
+    if not isinstance(job.get('config', {}), dict):
+        raise ValueError('Configurations must be JSON objects')
+
+    return job
+
+
+def _merge_config(config: dict, overrides: dict) -> None:
+    """
+    Updates recursively a configuration with the values of a job
+
+    Parameters
+    ----------
+    config : dict
+        Configuration to update
+
+    overrides : dict
+        Values of the job
+
+    Returns
+    ----------
+
+    """
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(config.get(key), dict):
+            _merge_config(config[key], value)
+        else:
+            config[key] = value
+
+
+JOBS = {'fit': _fit_job,
+        'simulate': _simulate_job,
+        'scenario': _scenario_job}
+
+
+class JobServer():  # pylint: disable=too-few-public-methods
+    """
+    Class to represent the job server.
+
+    Attributes
+    ----------
+    config : dict
+        Configuration of the server
+
+    configPath : str
+        Path of the TOML configuration loaded by the workers
+
+    Methods
+    ----------
+    serve()
+        Starts the pool and answers the requests until cancelled
+
+    """
+    def __init__(self, config: dict, configPath: str):
+        """
+        Constructor of the job server.
+
+        Parameters
+        ----------
+        config : dict
+            Configuration of the server
+
+        configPath : str
+            Path of the TOML configuration loaded by the workers
+
+        Returns
+        ----------
+
+        """
+        self.config = config
+        self.configPath = configPath
+        self._clients = {}
+        self._ids = itertools.count()
+        self._pool = None
+        self._progress = None
+        self._queue = None
+        self._finished = set()
+
+    async def serve(self):
+        """
+        Starts the pool and answers the requests until cancelled.
+
+        Parameters
+        ----------
+
+        Returns
+        ----------
+
+        """
+        numWorkers = self.config['workers']
+        self._queue = asyncio.PriorityQueue()
+
+        # Forked workers would inherit the sockets of the clients, which
+        # then stay open after they are closed here
+        context = multiprocessing.get_context('spawn')
+        self._progress = context.Queue()
+        self._pool = ProcessPoolExecutor(numWorkers, mp_context=context,
+                                         initializer=warm_up,
+                                         initargs=(self.configPath,
+                                                   self._progress))
+
+        # Every dispatcher keeps one worker busy, so the jobs wait in the
+        # priority queue instead of in the pool
+        tasks = [asyncio.ensure_future(self._dispatch())
+                 for _ in range(numWorkers)]
+        tasks.append(asyncio.ensure_future(self._route_progress()))
+
+        limit = self.config['max_request_bytes']
+        if self.config['socket']:
+            server = await asyncio.start_unix_server(
+                self._handle, self.config['socket'], limit=limit)
+        else:
+            server = await asyncio.start_server(
+                self._handle, self.config['host'], self.config['port'],
+                limit=limit)
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._progress.put(None)
+            self._pool.shutdown()
+
+    async def _handle(self, reader, writer):
+        """
+        Reads the jobs requested through a connection.
+
+        Parameters
+        ----------
+        reader : asyncio.StreamReader
+            Stream of the requests
+
+        writer : asyncio.StreamWriter
+            Stream of the events
+
+        Returns
+        ----------
+
+        """
+        while True:
+            try:
+                line = await reader.readline()
+            except (ValueError, asyncio.LimitOverrunError):
+                # The rest of the request cannot be told apart from the
+                # next one, so the connection takes no more requests
+                await self._send(writer, {
+                    'event': 'error',
+                    'message': 'Requests are limited to '
+                               f"{self.config['max_request_bytes']} bytes"})
+                break
+            if not line:
+                break
+
+            try:
+                job = parse_job(line)
+            except ValueError as error:
+                await self._send(writer, {'event': 'error',
+                                          'message': str(error)})
+                continue
+
+            jobId = next(self._ids)
+            self._clients[jobId] = writer
+
+            # Higher priorities first, and then in order of arrival
+            self._queue.put_nowait((-job.get('priority', 0), jobId, job))
+            await self._send(writer, {'id': jobId, 'event': 'queued'})
+
+        # The connection is closed once its jobs have finished
+        self._finished.add(writer)
+        self._close_finished(writer)
+
+    async def _dispatch(self):
+        """
+        Sends the queued jobs to the pool.
+
+        Parameters
+        ----------
+
+        Returns
+        ----------
+
+        """
+        loop = asyncio.get_running_loop()
+
+        while True:
+            _, jobId, job = await self._queue.get()
+            writer = self._clients[jobId]
+
+            await self._send(writer, {'id': jobId, 'event': 'started'})
+            try:
+                result = await loop.run_in_executor(self._pool, run_job,
+                                                    jobId, job)
+                event = {'id': jobId, 'event': 'result', 'result': result}
+            except Exception as error:  # pylint: disable=broad-except
+                event = {'id': jobId, 'event': 'error',
+                         'message': f'{type(error).__name__}: {error}'}
+
+            await self._send(writer, event)
+            del self._clients[jobId]
+            self._close_finished(writer)
+
+    async def _route_progress(self):
+        """
+        Sends the progress reported by the workers to its clients.
+
+        Parameters
+        ----------
+
+        Returns
+        ----------
+
+        """
+        loop = asyncio.get_running_loop()
+
+        while True:
+            message = await loop.run_in_executor(None, self._progress.get)
+            if message is None:
+                return
+
+            jobId, event = message
+            if jobId in self._clients:
+                event['id'] = jobId
+                await self._send(self._clients[jobId], event)
+
+    def _close_finished(self, writer) -> None:
+        """
+        Closes a connection whose client sent all its requests, once the
+        jobs of them have finished.
+
+        Parameters
+        ----------
+        writer : asyncio.StreamWriter
+            Stream of the events
+
+        Returns
+        ----------
+
+        """
+        if writer in self._finished \
+                and writer not in self._clients.values():
+            self._finished.discard(writer)
+            writer.close()
+
+    @staticmethod
+    async def _send(writer, event: dict):
+        """
+        Writes an event in a connection, if it is still open.
+
+        Parameters
+        ----------
+        writer : asyncio.StreamWriter
+            Stream of the events
+
+        event : dict
+            Event to send
+
+        Returns
+        ----------
+
+        """
+        if writer.is_closing():
+            return
+
+        try:
+            writer.write(json.dumps(event).encode() + b'\n')
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+
+def submit(job: dict, config: dict):
+    """
+    Client that submits a job and yields its events until it ends
+
+    Parameters
+    ----------
+    job : dict
+        Request of the job, see the module documentation
+
+    config : dict
+        Configuration of the server
+
+    Returns
+    ----------
+    event : dict
+        Each of the events of the job
+
+    """
+    if config['socket']:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(config['socket'])
+    else:
+        connection = socket.create_connection((config['host'],
+                                               config['port']))
+
+    with connection, connection.makefile('rwb') as stream:
+        stream.write(json.dumps(job).encode() + b'\n')
+        stream.flush()
+
+        for line in stream:
+            event = json.loads(line)
+            yield event
+
+            if event['event'] in ('result', 'error'):
+                return
+
+
+if __name__ == "__main__":
+    CONFIG_PATH = '../config/configuration.toml'
+    SERVER = JobServer(toml.load(CONFIG_PATH, _dict=dict)['server'],
+                       CONFIG_PATH)
+    asyncio.run(SERVER.serve())
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#    Epidemic Models - Calculates parameters of epidemic models
+#    Copyright (C) 2020 Carlos Moreno
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#    See LICENSE
+
+"""
+Results store
+
+Columnar store of runs: each run is a directory with one raw binary
+file per array, which grows by appending rows, and a JSON manifest with
+the metadata of the run and the type and shape of every array. Arrays
+are read back as memory maps, so slicing them only reads what is used.
+
+"""
+
+#######################################################################
+# Imports area
+#######################################################################
+
+# Generic / Built-in
+from datetime import datetime
+import json
+import os
+
+# Other Libs
+import numpy as np
+
+
+# Own Libs
+
+
+#######################################################################
+
+
+class ResultsStore():
+    """
+    Class to represent a store of runs.
+
+    Attributes
+    ----------
+    path : str
+        Directory of the store
+
+
+    Methods
+    ----------
+    append(run, name, rows)
+        Append rows to an array of a run
+
+    create_run(metadata)
+        Create a new run and return its name
+
+    metadata(run)
+        Return the metadata of a run
+
+    read(run, name)
+        Return an array of a run as a read-only memory map
+
+    runs()
+        Return the names of the runs of the store
+
+    update_metadata(run, metadata)
+        Add entries to the metadata of a run
+
+    """
+    def __init__(self, path: str):
+        """
+        Constructor of a store, created if it does not exist.
+
+        Parameters
+        ----------
+        path : str
+            Directory of the store
+
+        Returns
+        ----------
+
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def runs(self) -> list:
+        """
+        Returns the names of the runs, from oldest to newest.
+
+        Parameters
+        ----------
+
+        Returns
+        ----------
+        runs : list [str]
+            Names of the runs
+
+        """
+        return sorted(run for run in os.listdir(self.path)
+                      if os.path.exists(self._manifest_path(run)))
+
+    def create_run(self, metadata=None) -> str:
+        """
+        Creates a new empty run.
+
+        Parameters
+        ----------
+        metadata : dict, optional
+            JSON serialisable description of the run
+
+        Returns
+        ----------
+        run : str
+            Name of the run, from its creation time and process
+
+        """
+        run = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}_{os.getpid()}"
+        os.makedirs(os.path.join(self.path, run))
+
+        self._write_manifest(run, {'metadata': dict(metadata or {},
+                                                    created=run),
+                                   'arrays': {}})
+
+        return run
+
+    def metadata(self, run: str) -> dict:
+        """
+        Returns the metadata of a run.
+
+        Parameters
+        ----------
+        run : str
+            Name of the run
+
+        Returns
+        ----------
+        metadata : dict
+            Description of the run
+
+        """
+        return self._read_manifest(run)['metadata']
+
+    def update_metadata(self, run: str, metadata: dict) -> None:
+        """
+        Adds entries to the metadata of a run.
+
+        Parameters
+        ----------
+        run : str
+            Name of the run
+
+        metadata : dict
+            JSON serialisable entries
+
+        Returns
+        ----------
+
+        """
+        manifest = self._read_manifest(run)
+        manifest['metadata'].update(metadata)
+        self._write_manifest(run, manifest)
+
+    def append(self, run: str, name: str, rows: np.ndarray) -> None:
+        """
+        Appends rows to an array of a run, creating it with the type and
+        the shape of the rows if it does not exist.
+
+        Parameters
+        ----------
+        run : str
+            Name of the run
+
+        name : str
+            Name of the array
+
+        rows : np.ndarray (M x ...)
+            Rows appended
+
+        Returns
+        ----------
+
+        """
+        manifest = self._read_manifest(run)
+        arrays = manifest['arrays']
+        rows = np.asarray(rows)
+
+        if name not in arrays:
+            arrays[name] = {'dtype': rows.dtype.str,
+                            'shape': list(rows.shape[1:]),
+                            'length': 0}
+
+        array = arrays[name]
+        if list(rows.shape[1:]) != array['shape']:
+            raise ValueError(f'Rows of shape {rows.shape[1:]} appended to '
+                             f"{name} of shape {tuple(array['shape'])}")
+
+        # The data are flushed before the manifest counts them, so readers
+        # never see rows that are not written. The rows of an interrupted
+        # append that the manifest does not count are overwritten
+        dtype = np.dtype(array['dtype'])
+        rowBytes = dtype.itemsize * int(np.prod(array['shape']))
+        path = self._array_path(run, name)
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') \
+                as arrayFile:
+            arrayFile.seek(array['length'] * rowBytes)
+            arrayFile.truncate()
+            arrayFile.write(np.ascontiguousarray(rows, dtype=dtype).tobytes())
+
+        array['length'] += len(rows)
+        self._write_manifest(run, manifest)
+
+    def read(self, run: str, name: str) -> np.ndarray:
+        """
+        Returns an array of a run, memory mapped.
+
+        Parameters
+        ----------
+        run : str
+            Name of the run
+
+        name : str
+            Name of the array
+
+        Returns
+        ----------
+        array : np.memmap (M x ...)
+            Read-only array, only the slices used are loaded
+
+        """
+        array = self._read_manifest(run)['arrays'][name]
+        shape = (array['length'],) + tuple(array['shape'])
+
+        if array['length'] == 0:
+            return np.zeros(shape, dtype=np.dtype(array['dtype']))
+
+        return np.memmap(self._array_path(run, name), mode='r',
+                         dtype=np.dtype(array['dtype']), shape=shape)
+
+    def _array_path(self, run: str, name: str) -> str:
+        """
+        File of an array of a run
+
+        Parameters
+        ----------
+        run : str
+            Name of the run
+
+        name : str
+            Name of the array
+
+        Returns
+        ----------
+        path : str
+            Path of the raw binary file
+
+        """
+        return os.path.join(self.path, run, f'{name}.bin')
+
+    def _manifest_path(self, run: str) -> str:
+        """
+        Manifest of a run
+
+        Parameters
+        ----------
+        run : str
+            Name of the run
+
+        Returns
+        ----------
+        path : str
+            Path of the JSON manifest
+
+        """
+        return os.path.join(self.path, run, 'manifest.json')
+
+    def _read_manifest(self, run: str) -> dict:
+        """
+        Reads the manifest of a run
+
+        Parameters
+        ----------
+        run : str
+            Name of the run
+
+        Returns
+        ----------
+        manifest : dict
+            Metadata and arrays of the run
+
+        """
+        with open(self._manifest_path(run), encoding='utf-8') as manifestFile:
+            return json.load(manifestFile)
+
+    def _write_manifest(self, run: str, manifest: dict) -> None:
+        """
+        Replaces atomically the manifest of a run
+
+        Parameters
+        ----------
+        run : str
+            Name of the run
+
+        manifest : dict
+            Metadata and arrays of the run
+
+        Returns
+        ----------
+
+        """
+        path = self._manifest_path(run)
+        with open(path + '.tmp', 'w', encoding='utf-8') as manifestFile:
+            json.dump(manifest, manifestFile, indent=1)
+
+        os.replace(path + '.tmp', path)
+
+
+class HistoryRecorder():  # pylint: disable=too-few-public-methods
+    """
+    Class to represent a callback of the optimisers that streams their
+    history to a run of a store.
+
+    Attributes
+    ----------
+    run : str
+        Name of the run
+
+    store : ResultsStore
+        Store of the run
+
+    """
+    def __init__(self, store: ResultsStore, run: str):
+        """
+        Constructor of a recorder.
+
+        Parameters
+        ----------
+        store : ResultsStore
+            Store of the run
+
+        run : str
+            Name of the run
+
+        Returns
+        ----------
+
+        """
+        self.store = store
+        self.run = run
+        self._archived = 0
+
+    def __call__(self, generation: int, optimiser) -> None:
+        """
+        Appends the evaluations of the generation to the run: the new
+        entries of the archive and the best score so far.
+
+        Parameters
+        ----------
+        generation : int
+            Number of the generation
+
+        optimiser : ~GA.optimiser.Optimiser
+            Optimiser that calls back
+
+        Returns
+        ----------
+
+        """
+        chromosomes, scores = optimiser.archive
+        self.store.append(self.run, 'archive_chromosomes',
+                          chromosomes[self._archived:])
+        self.store.append(self.run, 'archive_scores', scores[self._archived:])
+        self._archived = len(scores)
+
+        _, bestScore = optimiser.best()
+        self.store.append(self.run, 'history',
+                          np.array([[generation, bestScore,
+                                     len(scores)]], dtype=float))